@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Throughput and tail latency of the mainloop's ready queue batching.
+
+Ping-pong messages over socketpairs while some busy tasks keep the ready queue full,
+with different batch_size / batch_time between two I/O polls.
+batch_size=1 is the old interleaving: poll I/O after every task.
+
+$ python benchmarks/batching.py [pairs] [messages per pair] [busy tasks]
+"""
+import sys
+import time
+import socket
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import ReadWait, Sleep
+
+CONFIGS = [
+    (1, None), # poll after every task switch
+    (16, None),
+    (64, None),
+    (256, None),
+    (None, None), # one pass of the ready queue
+    (None, 0.0005),
+    (None, 0.002),
+]
+
+
+def pinger(sock, peer, messages, latencies, total, flag):
+    for _ in xrange(messages):
+        start = time.time()
+        sock.send('x')
+        yield ReadWait(sock)
+        sock.recv(1)
+        latencies.append(time.time() - start)
+    # close both here, the task waiting on a hung up fd will be killed
+    sock.close()
+    peer.close()
+    if len(latencies) == total: # the last one stops the busy tasks
+        flag.pop()
+
+def ponger(sock, messages):
+    for _ in xrange(messages):
+        yield ReadWait(sock)
+        sock.send(sock.recv(1))
+
+def busy(flag):
+    while flag:
+        yield Sleep(0)
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def run(s, batch_size, batch_time, pairs, messages, busy_tasks):
+    s.batch_size = batch_size
+    s.batch_time = batch_time
+    latencies = []
+    flag = [True]
+    for _ in range(pairs):
+        a, b = socket.socketpair()
+        a.setblocking(0)
+        b.setblocking(0)
+        s.new(pinger(a, b, messages, latencies, pairs * messages, flag))
+        s.new(ponger(b, messages))
+    for _ in range(busy_tasks):
+        s.new(busy(flag))
+    start = time.time()
+    s.mainloop()
+    elapsed = time.time() - start
+    latencies.sort()
+    print 'batch_size=%s batch_time=%s messages/s=%.0f p50_ms=%.3f p99_ms=%.3f max_ms=%.3f' % \
+        (batch_size, batch_time, len(latencies) / elapsed, percentile(latencies, 0.5) * 1000,
+         percentile(latencies, 0.99) * 1000, latencies[-1] * 1000)
+
+def main():
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    busy_tasks = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    s = get_scheduler()
+    for batch_size, batch_time in CONFIGS:
+        run(s, batch_size, batch_time, pairs, messages, busy_tasks)
+
+if __name__ == '__main__':
+    main()
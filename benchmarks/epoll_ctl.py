@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Count the epoll_ctl syscalls per request of the examples/helloworld.py server,
+with and without persistent epoll registrations.
+
+$ python benchmarks/epoll_ctl.py [connections] [requests per connection]
+"""
+import os
+import sys
+import time
+import signal
+import socket
+
+from litchi.schedule import Scheduler
+from litchi.http import HTTPServer
+
+PORT = 8092
+
+
+class CountingEPoll(object):
+    """Count the calls on a select.epoll object."""
+    def __init__(self, epoll):
+        self.epoll = epoll
+        self.counts = dict(register=0, modify=0, unregister=0, poll=0)
+        
+    def __getattr__(self, name):
+        method = getattr(self.epoll, name)
+        if name not in self.counts:
+            return method
+        def call(*args):
+            self.counts[name] += 1
+            return method(*args)
+        return call
+
+
+def serve(persistent):
+    counter = []
+    def handler(request):
+        if request.path == '/stats':
+            yield repr(counter[0].counts)
+        yield 'Hello world %s' % PORT
+    httpserver = HTTPServer(handler)
+    httpserver.listen(PORT)
+    s = Scheduler(persistent_io=persistent)
+    counter.append(CountingEPoll(s.hub.epoll))
+    s.hub.epoll = counter[0]
+    s.new(httpserver.start())
+    s.mainloop()
+
+def request(sock, path):
+    sock.sendall('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path)
+    data = ''
+    while '\r\n\r\n' not in data:
+        data += sock.recv(4096)
+    head, body = data.split('\r\n\r\n', 1)
+    length = int([line.split(': ')[1] for line in head.split('\r\n') 
+                  if line.lower().startswith('content-length')][0])
+    while len(body) < length:
+        body += sock.recv(4096)
+    return body
+
+def connect():
+    for _ in range(100):
+        try:
+            return socket.create_connection(('127.0.0.1', PORT))
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError('server not start')
+
+def run(persistent, connections, requests):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            serve(persistent)
+        finally:
+            os._exit(0)
+    try:
+        socks = [connect() for _ in range(connections)]
+        start = time.time()
+        for _ in range(requests):
+            for sock in socks:
+                request(sock, '/')
+        elapsed = time.time() - start
+        counts = eval(request(socks[0], '/stats'))
+        for sock in socks:
+            sock.close()
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    total = connections * requests
+    ctl = counts['register'] + counts['modify'] + counts['unregister']
+    print 'persistent=%s requests=%d epoll_ctl=%d epoll_ctl/request=%.2f ' \
+        'epoll_wait/request=%.2f req/s=%.0f' % \
+        (persistent, total, ctl, float(ctl) / total, float(counts['poll']) / total, total / elapsed)
+    return float(ctl) / total
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    before = run(False, connections, requests)
+    after = run(True, connections, requests)
+    print 'saved epoll_ctl/request=%.2f' % (before - after)
+
+if __name__ == '__main__':
+    main()
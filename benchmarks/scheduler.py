@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The Scheduler microbenchmark suite.
+
+Every result is one line of key=value pairs, the parameters first, then the metrics.
+cost_ns is in every line and lower is better, so the lines of two runs can be compared:
+
+$ python benchmarks/scheduler.py > baseline.txt
+$ python benchmarks/scheduler.py --baseline baseline.txt --tolerance 0.2
+
+With --baseline, the results whose cost_ns grow more than tolerance are reported as
+regression=... and the exit status is 1.
+Run only some benchmarks by names: $ python benchmarks/scheduler.py switch spawn
+"""
+import os
+import sys
+import time
+import socket
+import random
+import resource
+import optparse
+import threading
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, Sleep, Wait, Fire
+from litchi.io import SelectEventHub, EPollEventHub
+from litchi.sync import Queue
+from litchi.socketwrap import Socket
+
+# the keys which are measured, the others identify a result
+METRICS = ('cost_ns', 'ops_per_s', 'mb_per_s', 'level_ns', 'p50_us', 'p99_us', 'max_us')
+
+REPEAT = 3
+
+# the lines reported in this run
+RESULTS = []
+
+
+def report(**fields):
+    params = ['%s=%s' % (k, fields.pop(k)) for k in ('bench',) + tuple(sorted(fields))
+              if k in fields and k not in METRICS]
+    metrics = ['%s=%s' % (k, fields[k]) for k in METRICS if k in fields]
+    line = ' '.join(params + metrics)
+    RESULTS.append(line)
+    print line
+    sys.stdout.flush()
+
+def best_of(func, *args):
+    """Run func REPEAT times, return the shortest elapsed seconds."""
+    best = None
+    for _ in xrange(REPEAT):
+        elapsed = func(*args)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def mainloop(s):
+    start = time.time()
+    s.mainloop()
+    return time.time() - start
+
+# context switch
+
+def _switcher(n):
+    for _ in xrange(n):
+        yield
+
+def bench_switch(s, quick):
+    switches = 200 if quick else 2000
+    for tasks in (1, 100, 1000):
+        def run():
+            for _ in xrange(tasks):
+                s.new(_switcher(switches))
+            return mainloop(s)
+        elapsed = best_of(run)
+        ops = tasks * switches
+        report(bench='switch', tasks=tasks, cost_ns='%.0f' % (elapsed * 1e9 / ops),
+               ops_per_s='%.0f' % (ops / elapsed))
+
+# NewTask spawn, the child tasks run and exit
+
+def _child():
+    yield
+
+def _spawner(n):
+    for _ in xrange(n):
+        yield NewTask(_child())
+
+def bench_spawn(s, quick):
+    spawns = 2000 if quick else 50000
+    def run():
+        s.new(_spawner(spawns))
+        return mainloop(s)
+    elapsed = best_of(run)
+    report(bench='spawn', cost_ns='%.0f' % (elapsed * 1e9 / spawns), ops_per_s='%.0f' % (spawns / elapsed))
+
+# trampolining, call a chain of nested coroutines and get the result back
+
+def _chain(depth):
+    if depth == 1:
+        yield 1
+    else:
+        value = yield _chain(depth - 1)
+        yield value
+
+def _caller(depth, calls):
+    for _ in xrange(calls):
+        yield _chain(depth)
+
+def bench_trampolining(s, quick):
+    for depth in (1, 10, 100):
+        calls = (2000 if quick else 20000) // depth
+        def run():
+            s.new(_caller(depth, calls))
+            return mainloop(s)
+        elapsed = best_of(run)
+        report(bench='trampolining', depth=depth, cost_ns='%.0f' % (elapsed * 1e9 / calls),
+               level_ns='%.0f' % (elapsed * 1e9 / calls / depth))
+
+# Sleep wakeup accuracy, how late the tasks wake up
+
+def _sleeper(seconds, times, lateness):
+    for _ in xrange(times):
+        start = time.time()
+        yield Sleep(seconds)
+        lateness.append(time.time() - start - seconds)
+
+def bench_sleep(s, quick):
+    times = 5 if quick else 20
+    for tasks in (10, 100):
+        lateness = []
+        for _ in xrange(tasks):
+            s.new(_sleeper(random.uniform(0.001, 0.01), times, lateness))
+        mainloop(s)
+        lateness.sort()
+        report(bench='sleep', tasks=tasks, cost_ns='%.0f' % (percentile(lateness, 0.5) * 1e9),
+               p50_us='%.0f' % (percentile(lateness, 0.5) * 1e6), p99_us='%.0f' % (percentile(lateness, 0.99) * 1e6),
+               max_us='%.0f' % (lateness[-1] * 1e6))
+
+# Wait/Fire ping-pong between pairs of tasks
+
+def _pinger(ping, pong, rounds):
+    for _ in xrange(rounds):
+        yield Fire(ping)
+        yield Wait(pong)
+
+def _ponger(ping, pong, rounds):
+    for _ in xrange(rounds):
+        yield Wait(ping)
+        yield Fire(pong)
+
+def bench_wait_fire(s, quick):
+    rounds = 500 if quick else 5000
+    for pairs in (1, 100):
+        def run():
+            for i in xrange(pairs):
+                ping, pong = ('ping', i), ('pong', i)
+                s.new(_ponger(ping, pong, rounds)) # wait first
+                s.new(_pinger(ping, pong, rounds))
+            return mainloop(s)
+        elapsed = best_of(run)
+        ops = pairs * rounds
+        report(bench='wait_fire', pairs=pairs, cost_ns='%.0f' % (elapsed * 1e9 / ops),
+               ops_per_s='%.0f' % (ops / elapsed))
+
+# bounded Queue producer/consumer pipeline
+
+def _producer(queue, items):
+    for i in xrange(items):
+        yield queue.put(i)
+    yield queue.put(None)
+
+def _consumer(queue):
+    while (yield queue.get()) is not None:
+        pass
+
+def bench_queue(s, quick):
+    items = 2000 if quick else 20000
+    for maxsize in (1, 100):
+        def run():
+            queue = Queue(maxsize)
+            s.new(_producer(queue, items))
+            s.new(_consumer(queue))
+            return mainloop(s)
+        elapsed = best_of(run)
+        report(bench='queue', maxsize=maxsize, cost_ns='%.0f' % (elapsed * 1e9 / items),
+               ops_per_s='%.0f' % (items / elapsed))
+
+# EventHub poll with many idle fds and one readable fd
+
+def _raise_fd_limit(fds):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < fds and (hard == resource.RLIM_INFINITY or soft < hard):
+        try:
+            soft = fds if hard == resource.RLIM_INFINITY else min(fds, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        except (ValueError, resource.error):
+            pass
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+def bench_poll(s, quick):
+    polls = 200 if quick else 2000
+    idle_r, idle_w = os.pipe() # dup the idle read end, never readable
+    ready_r, ready_w = os.pipe()
+    os.write(ready_w, 'x')
+    try:
+        for size in (10, 1000, 50000):
+            if _raise_fd_limit(size + 64) < size + 64:
+                report(bench='poll', fds=size, skipped='fd_limit')
+                continue
+            for name, hub_class in (('select', SelectEventHub), ('epoll', EPollEventHub)):
+                if hub_class is SelectEventHub and size >= 1000: # FD_SETSIZE is 1024
+                    continue
+                hub = hub_class()
+                fds = [os.dup(idle_r) for _ in xrange(size - 1)]
+                try:
+                    for fd in fds:
+                        hub.register(fd, hub.READ)
+                    hub.register(ready_r, hub.READ)
+                    def run():
+                        start = time.time()
+                        for _ in xrange(polls):
+                            hub.poll(0)
+                        return time.time() - start
+                    elapsed = best_of(run)
+                finally:
+                    for fd in fds:
+                        hub.unregister(fd)
+                        os.close(fd)
+                    hub.unregister(ready_r)
+                report(bench='poll', hub=name, fds=size, cost_ns='%.0f' % (elapsed * 1e9 / polls),
+                       ops_per_s='%.0f' % (polls / elapsed))
+    finally:
+        for fd in (idle_r, idle_w, ready_r, ready_w):
+            os.close(fd)
+
+# Socket reads of a multi-MB payload, a body by read_bytes or lines by read_until
+
+def _send_all(sock, payload):
+    for i in xrange(0, len(payload), 65536): # as it comes from the network
+        sock.sendall(payload[i:i + 65536])
+
+def _read_body(sock, size):
+    yield sock.read_bytes(size)
+
+def _read_lines(sock, lines):
+    for _ in xrange(lines):
+        yield sock.read_until('\r\n')
+
+def bench_socket_read(s, quick):
+    line = 'x' * 98 + '\r\n'
+    for size_mb in ((1,) if quick else (1, 10)):
+        size = size_mb * 1024 * 1024
+        for mode in ('bytes', 'lines'):
+            payload = 'x' * size if mode == 'bytes' else line * (size // len(line))
+            def run():
+                a, b = socket.socketpair()
+                reader = Socket(_sock=a)
+                sender = threading.Thread(target=_send_all, args=(b, payload))
+                if mode == 'bytes':
+                    s.new(_read_body(reader, len(payload)))
+                else:
+                    s.new(_read_lines(reader, len(payload) // len(line)))
+                start = time.time()
+                sender.start()
+                s.mainloop()
+                elapsed = time.time() - start
+                sender.join()
+                reader.close()
+                b.close()
+                return elapsed
+            elapsed = best_of(run)
+            report(bench='socket_read', mode=mode, size_mb=size_mb,
+                   cost_ns='%.0f' % (elapsed * 1e9 / size_mb), mb_per_s='%.0f' % (size_mb / elapsed))
+
+BENCHMARKS = [
+    ('switch', bench_switch),
+    ('spawn', bench_spawn),
+    ('trampolining', bench_trampolining),
+    ('sleep', bench_sleep),
+    ('wait_fire', bench_wait_fire),
+    ('queue', bench_queue),
+    ('poll', bench_poll),
+    ('socket_read', bench_socket_read),
+]
+
+
+def parse(line):
+    """Split a result line to (params, fields), params identify the result."""
+    fields = dict(field.split('=', 1) for field in line.split())
+    params = tuple(sorted((k, v) for k, v in fields.iteritems() if k not in METRICS))
+    return params, fields
+
+def compare(lines, baseline_file, tolerance):
+    """Report the results slower than the baseline, return the count of regressions."""
+    baseline = dict(parse(line) for line in open(baseline_file) if line.strip())
+    regressions = 0
+    for line in lines:
+        params, fields = parse(line)
+        old = baseline.get(params, {}).get('cost_ns')
+        if old is None or 'cost_ns' not in fields or float(old) <= 0:
+            continue
+        change = float(fields['cost_ns']) / float(old) - 1
+        if change > tolerance:
+            regressions += 1
+            print 'regression=%.2f %s baseline_cost_ns=%s' % (change, line, old)
+    return regressions
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('--quick', action='store_true', help='small sizes, for a smoke run')
+    parser.add_option('--baseline', help='compare with the output of a previous run')
+    parser.add_option('--tolerance', type='float', default=0.2,
+                      help='allowed cost_ns growth against the baseline, default 0.2')
+    options, names = parser.parse_args()
+    s = get_scheduler()
+    for name, bench in BENCHMARKS:
+        if not names or name in names:
+            bench(s, options.quick)
+    if options.baseline and compare(RESULTS, options.baseline, options.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
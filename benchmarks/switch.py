@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The per context switch cost of the Scheduler.
+
+$ python benchmarks/switch.py [tasks] [switches per task]
+"""
+import sys
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import Sleep, GetTaskid
+
+
+def plain(n):
+    for _ in xrange(n):
+        yield
+
+def sleep0(n):
+    for _ in xrange(n):
+        yield Sleep(0)
+
+def gettaskid(n):
+    for _ in xrange(n):
+        yield GetTaskid()
+
+def child():
+    yield 1
+
+def nested(n):
+    for _ in xrange(n):
+        yield child()
+
+def run(s, name, target, tasks, switches, repeat=5):
+    best = None
+    for _ in xrange(repeat):
+        for _ in xrange(tasks):
+            s.new(target(switches))
+        start = time.time()
+        s.mainloop()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print '%s ns/switch=%.0f' % (name, best * 1e9 / (tasks * switches))
+
+def main():
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    switches = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    s = get_scheduler()
+    for name, target in [('yield', plain), ('Sleep(0)', sleep0), ('GetTaskid', gettaskid), 
+                         ('trampolining', nested)]:
+        run(s, name, target, tasks, switches)
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@
 """
 from socket import socket, AF_INET, SOCK_STREAM
 
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.systemcall import ReadWait, NewTask, WriteWait
 
 
@@ -74,7 +74,7 @@ def alive():
         print 'I am alive!'
         yield
         
-s = Scheduler.instance()
+s = get_scheduler()
 #s.new(alive())
 s.new(server(45000))
 s.mainloop()
\ No newline at end of file
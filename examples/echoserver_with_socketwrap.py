@@ -4,7 +4,7 @@
 """
 from socket import AF_INET, SOCK_STREAM
 
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.systemcall import NewTask
 from litchi.socketwrap import Socket
         
@@ -53,7 +53,7 @@ def alive():
         print 'I am alive!'
         yield
         
-s = Scheduler.instance()
+s = get_scheduler()
 #s.new(alive())
 s.new(server(45002))
 s.mainloop()
\ No newline at end of file
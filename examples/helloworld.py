@@ -13,7 +13,7 @@ def handler(request):
 def main():
     httpserver = HTTPServer(handler)
     httpserver.listen(port)
-    s = Scheduler.instance(debug=False)
+    s = Scheduler(debug=False)
     s.new(httpserver.start())
     s.mainloop()
 
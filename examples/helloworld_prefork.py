@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""helloworld.py with one worker process per CPU
+"""
+import os
+
+from litchi.http import HTTPServer
+
+port = 8082
+
+def handler(request):
+    yield 'Hello world %s from %d' % (port, os.getpid())
+
+def main():
+    httpserver = HTTPServer(handler)
+    # reuse_port=True let the kernel balance the connections between the workers (Linux 3.9+)
+    httpserver.serve(port, num_processes=None, reuse_port=False)
+
+main()
@@ -3,7 +3,7 @@
 """how to use async mysql query
 """
 from litchi.db.mysql import connect
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 
 #def foo1():
 #    conn = raw_connect(host='10.20.238.182', port=3306, user='mercury', password='mercury123', db='webauth')
@@ -45,7 +45,7 @@ def foo():
 
 #import logging
 #logging.root.setLevel(logging.DEBUG)
-s = Scheduler.instance()
+s = get_scheduler()
 #s.new(alive())
 s.new(foo())
 s.mainloop()
\ No newline at end of file
@@ -7,7 +7,7 @@ from datetime import datetime
 import time
 
 from litchi.http import HTTPServer, HTTPReponse
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.db.mysql import connect
 from litchi.pool import Pool
 
@@ -57,7 +57,7 @@ def handler(request):
 #logging.root.setLevel(logging.DEBUG)
 httpserver = HTTPServer(handler)
 httpserver.listen(8081)
-schedule = Scheduler.instance()
+schedule = get_scheduler()
 schedule.new(pool.init())
 schedule.new(httpserver.start())
 schedule.mainloop()
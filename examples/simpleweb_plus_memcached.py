@@ -5,7 +5,7 @@
 from datetime import datetime
 
 from litchi.http import HTTPServer
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.pool import Pool
 from litchi.memcached import AsyncClient
 
@@ -47,7 +47,7 @@ def handler(request):
 #logging.root.setLevel(logging.DEBUG)
 httpserver = HTTPServer(handler)
 httpserver.listen(8081)
-schedule = Scheduler.instance()
+schedule = get_scheduler()
 schedule.new(pool.init(), 'pool.init')
 schedule.new(httpserver.start(), 'httpserver')
 schedule.mainloop()
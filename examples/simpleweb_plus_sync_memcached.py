@@ -5,7 +5,7 @@
 from datetime import datetime
 
 from litchi.http import HTTPServer
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.utils.memcache import Client
 
 
@@ -40,7 +40,7 @@ def handler(request):
 #logging.root.setLevel(logging.DEBUG)
 httpserver = HTTPServer(handler)
 httpserver.listen(8081)
-schedule = Scheduler.instance()
+schedule = get_scheduler()
 schedule.new(httpserver.start(), 'httpserver')
 schedule.mainloop()
 
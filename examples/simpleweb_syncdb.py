@@ -9,7 +9,7 @@ import time
 from mysql.connector import Connect
 
 from litchi.http import HTTPServer, HTTPReponse
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 
 conn = Connect(host='10.20.238.182', port=3306, user='mercury', password='mercury123', db='webauth')
 
@@ -39,7 +39,7 @@ def handler(request):
     
 httpserver = HTTPServer(handler)
 httpserver.listen(8081)
-schedule = Scheduler.instance()
+schedule = get_scheduler()
 schedule.new(httpserver.start())
 schedule.mainloop()
 
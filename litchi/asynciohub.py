@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Run the scheduler on an asyncio event loop, litchi tasks and asyncio code share one loop,
+and a faster loop implementation works for both once installed as the loop.
+
+loop = asyncio.get_event_loop()
+hub = AsyncioEventHub(loop)
+scheduler = Scheduler(hub=hub)
+scheduler.new(server.start())
+loop.run_until_complete(hub.start(scheduler)) # done when all the tasks exit
+
+The fds are watched by loop.add_reader/add_writer, and the task steps run from the loop
+callbacks, a batch every callback. A litchi task waits for an asyncio future or coroutine
+by Await, e.g. data = yield Await(reader.read(100)).
+
+Without start(), scheduler.mainloop() works too: every poll runs the loop until an fd ready,
+a future done or the timer deadline, the asyncio callbacks run only while the scheduler waits.
+
+On Python 2 the asyncio port trollius is used.
+"""
+import time
+import functools
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from litchi.io import EventHub
+from litchi.schedule import set_scheduler
+from litchi.systemcall import SystemCall
+
+
+class AsyncioEventHub(EventHub):
+    """The fds are watched by the asyncio loop. No ERROR event, the loop reports
+    the error and the hangup of an fd as readable or writable, the read or write fails then.
+    """
+
+    # the loop callbacks, e.g. a done future, wake up the scheduler too
+    external = True
+
+    def __init__(self, loop=None, persistent=False):
+        super(AsyncioEventHub, self).__init__(persistent)
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.events = {} # fd: the events ready since the last poll
+        self.scheduler = None # the scheduler driven by the loop callbacks, see start()
+        self.exception_handler = None
+        self.done = None # the future of start()
+        self._stepping = False # a step is scheduled
+        self._timer = None # the handle to step at the timer deadline
+        self._polling = False # poll() is running the loop
+
+    def register(self, fd, events, owner=None):
+        current = self.fds.get(fd, self.NONE)
+        if current == events:
+            return
+        loop = self.loop
+        if events & self.READ and not current & self.READ:
+            loop.add_reader(fd, self._ready, fd, self.READ)
+        elif current & self.READ and not events & self.READ:
+            loop.remove_reader(fd)
+        if events & self.WRITE and not current & self.WRITE:
+            loop.add_writer(fd, self._ready, fd, self.WRITE)
+        elif current & self.WRITE and not events & self.WRITE:
+            loop.remove_writer(fd)
+        super(AsyncioEventHub, self).register(fd, events)
+
+    def unregister(self, fd):
+        events = self.fds[fd]
+        super(AsyncioEventHub, self).unregister(fd)
+        if events & self.READ:
+            self.loop.remove_reader(fd)
+        if events & self.WRITE:
+            self.loop.remove_writer(fd)
+        self.events.pop(fd, None)
+
+    def _ready(self, fd, event):
+        self.events[fd] = self.events.get(fd, self.NONE) | event
+        self.notify()
+
+    def notify(self):
+        """Let the scheduler run: step it by a loop callback, or return from poll()."""
+        if self.scheduler is not None:
+            if not self._stepping:
+                self._stepping = True
+                self.loop.call_soon(self._step)
+        elif self._polling:
+            self._polling = False # stop the loop once
+            self.loop.stop()
+
+    def poll(self, timeout=0):
+        if self.scheduler is None and not self.events:
+            # called by the mainloop, run the loop until notify() or the timeout
+            self._polling = True
+            handle = None
+            if timeout == 0:
+                self.loop.call_soon(self.notify) # one loop iteration
+            elif timeout is not None:
+                handle = self.loop.call_later(timeout, self.notify)
+            try:
+                self.loop.run_forever()
+            finally:
+                self._polling = False
+                if handle is not None:
+                    handle.cancel()
+        events, self.events = self.events, {}
+        return events.items()
+
+    def start(self, scheduler, exception_handler=None):
+        """Drive the scheduler by the loop callbacks, instead of scheduler.mainloop().
+        @param exception_handler: see Scheduler.mainloop().
+        @return: a future, done when all the tasks exit or scheduler.stop() called,
+            or with the exception of a task not handled.
+        """
+        assert scheduler.hub is self, 'the scheduler MUST be created with this hub'
+        set_scheduler(scheduler)
+        scheduler.stopping = False
+        self.scheduler = scheduler
+        self.exception_handler = exception_handler
+        self.done = asyncio.Future(loop=self.loop)
+        self.notify()
+        return self.done
+
+    def _step(self):
+        self._stepping = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        scheduler = self.scheduler
+        try:
+            scheduler.run_once(self.exception_handler)
+        except BaseException, e:
+            self._finish(e)
+            if not isinstance(e, Exception): # KeyboardInterrupt, SystemExit
+                raise
+            return
+        if not scheduler.taskmap or scheduler.stopping:
+            self._finish()
+        elif scheduler.ready:
+            self.notify()
+        else:
+            deadline = scheduler.timers.next_deadline()
+            if deadline is not None:
+                self._timer = self.loop.call_later(max(0, deadline - time.time()), self.notify)
+
+    def _finish(self, error=None):
+        self.scheduler = None
+        if not self.done.done():
+            if error is not None:
+                self.done.set_exception(error)
+            else:
+                self.done.set_result(None)
+
+    def wait_future(self, scheduler, task, future):
+        """Let the task wait for the future, killing the task cancels the future."""
+        future = asyncio.ensure_future(future, loop=self.loop)
+        job = [task] # the task is dropped from it if killed
+        task.waiting = (self._stop_future_wait, scheduler, job, future)
+        future.add_done_callback(functools.partial(self._future_done, scheduler, job))
+
+    def _stop_future_wait(self, task, scheduler, job, future):
+        future.cancel()
+        scheduler._stop_job_wait(task, job)
+
+    def _future_done(self, scheduler, job, future):
+        if job[0] is None: # killed
+            return
+        if future.cancelled():
+            error = asyncio.CancelledError()
+            scheduler._resume(job, None, (type(error), error, None))
+        elif future.exception() is not None:
+            error = future.exception()
+            scheduler._resume(job, None, (type(error), error, None))
+        else:
+            scheduler._resume(job, future.result(), None)
+        self.notify()
+
+
+class Await(SystemCall):
+    """Wait for an asyncio future or coroutine in the loop of the scheduler's AsyncioEventHub,
+    the task gets its result, or its exception is thrown into the task.
+    """
+    __slots__ = ('future',)
+
+    def __init__(self, future):
+        self.future = future
+
+    def handle(self, scheduler, task):
+        scheduler.hub.wait_future(scheduler, task, self.future)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Audit the scheduler's tables periodically, to find the leaked tasks before they exhaust
+the memory or the fds.
+
+scheduler = get_scheduler()
+scheduler.new(Auditor(scheduler, stuck=300).run(60), 'Auditor', priority=PRIORITY_LOW)
+
+Every interval it logs the tasks counted by name and state, the oldest task age of every
+group, the growth of the tasks per second, and the sizes of the waiting tables.
+A task waiting in the same wait on a fd, an event, a queue or a task exit longer than
+stuck seconds is logged as a warning with its coroutines. The states:
+ready, read, write, sleep, event, queue (Lock, Queue...), exit (WaitTask/WaitAll), job
+(RunInThread/RunInProcess), other (running, or a woken task not queued yet).
+"""
+import time
+import logging
+
+from litchi.systemcall import Sleep
+from litchi.schedule import Scheduler
+
+# the states of the waits which can be stuck
+WAITS = ('read', 'write', 'event', 'queue', 'exit')
+
+# Task.waiting[0] is the scheduler method to stop the wait, it tells the state
+_STOPS = {
+    Scheduler._stop_io_wait.im_func: 'io',
+    Scheduler._stop_queue_wait.im_func: 'queue',
+    Scheduler._stop_exit_wait.im_func: 'exit',
+    Scheduler._stop_join_wait.im_func: 'exit',
+    Scheduler._stop_job_wait.im_func: 'job',
+}
+
+
+class Auditor(object):
+    """Take the snapshots of the scheduler, see snapshot()."""
+
+    def __init__(self, scheduler, stuck=300):
+        """
+        @param stuck: seconds in the same wait to report a task.
+        """
+        self.scheduler = scheduler
+        self.stuck = stuck
+        self.last = None # (time, the tasks count) of the last snapshot
+        self.seen = {} # taskid: (the waiting record, first seen time)
+
+    def _state(self, task, events):
+        """@return: (state, the waited key)."""
+        s = self.scheduler
+        if task.taskid in s.ready:
+            return 'ready', None
+        if task.taskid in s.sleep_waiting:
+            return 'sleep', None
+        waiting = task.waiting
+        if waiting is None:
+            return 'other', None
+        state = _STOPS.get(waiting[0].im_func, 'other')
+        if state == 'io':
+            return ('read' if waiting[2] is s.read_waiting else 'write'), waiting[1]
+        if state == 'queue' and id(waiting[1]) in events:
+            return 'event', events[id(waiting[1])]
+        if state in ('queue', 'exit'):
+            return state, waiting[1]
+        return state, None
+
+    def snapshot(self):
+        """@return: a dict, groups: {(name, state): {count, oldest}}, stuck: [(task, state, key, seconds)]."""
+        s = self.scheduler
+        now = time.time()
+        events = dict((id(queue), event) for event, queue in s.event_waitting.iteritems())
+        groups = {}
+        stuck = []
+        seen = {}
+        for task in s.taskmap.itervalues():
+            state, key = self._state(task, events)
+            group = groups.get((task.name, state))
+            if group is None:
+                group = groups[(task.name, state)] = dict(count=0, oldest=0.0)
+            group['count'] += 1
+            group['oldest'] = max(group['oldest'], now - task.created)
+            if state in WAITS:
+                # a new waiting record for every wait, the same one means the same wait
+                previous = self.seen.get(task.taskid)
+                since = previous[1] if previous is not None and previous[0] is task.waiting else now
+                seen[task.taskid] = (task.waiting, since)
+                if now - since >= self.stuck:
+                    stuck.append((task, state, key, now - since))
+        self.seen = seen
+        growth = None
+        if self.last is not None and now > self.last[0]:
+            growth = (len(s.taskmap) - self.last[1]) / (now - self.last[0])
+        self.last = (now, len(s.taskmap))
+        return dict(time=now, tasks=len(s.taskmap), growth=growth, groups=groups, stuck=stuck,
+                    tables=dict(ready=len(s.ready), read=len(s.read_waiting), write=len(s.write_waiting),
+                                sleep=len(s.sleep_waiting), timers=len(s.timers),
+                                exit_waiting=len(s.exit_waiting), exit_results=len(s.exit_results),
+                                event_slots=len(s.event_waitting)))
+
+    def format(self, snapshot):
+        """@return: a text report, the biggest groups first."""
+        growth = snapshot['growth']
+        lines = ['tasks %d, growth %s/s, tables: %s' % (
+            snapshot['tasks'], '%.2f' % growth if growth is not None else '-',
+            ' '.join('%s=%d' % item for item in sorted(snapshot['tables'].iteritems())))]
+        lines.append('%-24s %-6s %8s %10s' % ('name', 'state', 'count', 'oldest_s'))
+        for (name, state), group in sorted(snapshot['groups'].iteritems(), key=lambda item: -item[1]['count']):
+            lines.append('%-24s %-6s %8d %10.1f' % (name, state, group['count'], group['oldest']))
+        return '\n'.join(lines)
+
+    def audit(self):
+        """Take a snapshot and log it, the stuck tasks as warnings."""
+        snapshot = self.snapshot()
+        logging.info('scheduler audit\n%s' % self.format(snapshot))
+        for task, state, key, seconds in snapshot['stuck']:
+            logging.warning('%r waits %s %r for %.0fs, the coroutines:\n%s' % (
+                task, state, key, seconds, task.format_stack()))
+        return snapshot
+
+    def run(self, interval=60):
+        """The audit task, it exits when no other task left."""
+        while len(self.scheduler.taskmap) > 1:
+            yield Sleep(interval)
+            self.audit()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Task-local context, the per-request state like the request id, a tracing span or a deadline,
+readable from any coroutine of the task without passing it through every call.
+
+from litchi import context
+
+def handler(request):
+    context.set('request_id', request.headers.get('X-Request-Id'))
+    yield NewTask(audit(), inherit_context=True) # the child gets a copy of the context
+    ...
+
+def query(sql): # deep in the db layer
+    logging.info('%s %s' % (context.get('request_id'), sql))
+
+The mainloop sets Scheduler.current to the task running its step, O(1) per switch.
+The context dict of a task is created by the first set(). Out of a task, get() returns the default.
+"""
+from litchi.schedule import _current
+
+
+def current_task():
+    """@return: the task running its step, None out of a task.
+    A thread without scheduler, e.g. a RunInThread worker, has no task, no scheduler is created.
+    """
+    scheduler = getattr(_current, 'scheduler', None)
+    return scheduler.current if scheduler is not None else None
+
+
+def local():
+    """@return: the context dict of the running task, created if it has none."""
+    task = current_task()
+    if task is None:
+        raise RuntimeError('no task running, the context is task-local')
+    if task.context is None:
+        task.context = {}
+    return task.context
+
+
+def get(key, default=None):
+    task = current_task()
+    if task is None or task.context is None:
+        return default
+    return task.context.get(key, default)
+
+
+def set(key, value):
+    local()[key] = value
+
+
+def delete(key):
+    local().pop(key, None)
@@ -4,6 +4,8 @@
 """
 
 import os
+import sys
+import signal
 import socket
 import errno
 import urlparse
@@ -16,7 +18,12 @@ import calendar
 import email.utils
 
 from litchi.socketwrap import Socket
-from litchi.systemcall import NewTask
+from litchi.systemcall import NewTask, GetTaskid, KillTask, WaitAll, TimeoutError
+from litchi.schedule import get_scheduler, PRIORITY_HIGH
+from litchi.process import fork_processes, spawn_reload, inherited_socket, wait_signals
+
+# SO_REUSEPORT is not in the socket module before python 3.x, the value on Linux
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
 
 
 class HTTPServer(object):
@@ -27,9 +34,18 @@ class HTTPServer(object):
         self.xheaders = xheaders
         self.ssl_options = ssl_options
         self._socket = None
+        self._accept_taskid = None
+        self.handlers = {} # the running connection handler tasks, taskid: HTTPConnection
 
-    def listen(self, port, address=""):
+    def listen(self, port, address="", reuse_port=False):
+        """Bind and listen the port, or take the listening socket inherited from the reloaded process.
+        @param reuse_port: set SO_REUSEPORT, let every worker process listen its own socket on the same port.
+        """
         assert not self._socket
+        inherited = inherited_socket(port)
+        if inherited is not None:
+            self._socket = Socket(_sock=inherited)
+            return
         self._socket = Socket()
         if os.name != 'nt':
             # Make a file descriptor close-on-exec.
@@ -39,6 +55,8 @@ class HTTPServer(object):
             fcntl.fcntl(self._socket.fileno(), fcntl.F_SETFD, flags)
         # reuse address
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) 
+        if reuse_port:
+            self._socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         # set non blocking
         self._socket.setblocking(0)
         
@@ -46,16 +64,75 @@ class HTTPServer(object):
         self._socket.listen(65535)
 
     def start(self):
+        self._accept_taskid = yield GetTaskid()
         while True:
             try:
                 connection, address = yield self._socket.accept()
             except socket.error, e:
-                if e[0] in (errno.EWOULDBLOCK, errno.EAGAIN): # omit Operation would block and Try again error
-                    return
+                # omit Operation would block and Try again error, 
+                # other worker process accepted the connection first
+                if e[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    continue
                 raise
             # print 'new', connection, address, connection.fileno()
-            yield NewTask(HTTPConnection(connection, address, self.handle_target, 
-                                         xheaders=self.xheaders).handler(), 'httphandler')
+            yield NewTask(self._handle(HTTPConnection(connection, address, self.handle_target, 
+                                                      xheaders=self.xheaders)), 'httphandler')
+            
+    def _handle(self, connection):
+        taskid = yield GetTaskid()
+        self.handlers[taskid] = connection
+        try:
+            yield connection.handler()
+        finally:
+            del self.handlers[taskid]
+            
+    def shutdown(self, timeout=None, pools=()):
+        """Stop accepting, let the in-flight requests finish, then close the pools.
+        The idle keep-alive connections are closed at once, the others after their current response.
+        The handlers still running after timeout seconds are killed.
+        @param pools: the litchi.pool.Pool to close after the handlers finished.
+        """
+        if self._accept_taskid is not None:
+            yield KillTask(self._accept_taskid)
+            self._accept_taskid = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        deadline = time.time() + timeout if timeout is not None else None
+        idle = []
+        for taskid, connection in self.handlers.items():
+            connection.no_keep_alive = True
+            if connection.idle():
+                idle.append(taskid)
+        if idle:
+            yield KillTask(idle)
+        if self.handlers:
+            taskids = self.handlers.keys()
+            try:
+                yield WaitAll(taskids, None if deadline is None else max(0, deadline - time.time()))
+            except TimeoutError:
+                logging.warning('%d requests not finished in %ss, killed' % (len(self.handlers), timeout))
+                yield KillTask(taskids)
+                yield WaitAll(taskids)
+        for pool in pools:
+            yield pool.close(None if deadline is None else max(0, deadline - time.time()))
+            
+    def stop_on_signals(self, timeout=30, pools=(), reload=True):
+        """Wait for SIGTERM or SIGINT, then shutdown() and stop the scheduler, run it as a task.
+        @param timeout: the seconds to drain the in-flight requests.
+        @param reload: SIGHUP starts a new copy of the process which inherits the listening socket
+            before the shutdown, so the connections are never refused, see litchi.process.spawn_reload().
+        """
+        signums = [signal.SIGTERM, signal.SIGINT]
+        if reload:
+            signums.append(signal.SIGHUP)
+        signum = yield wait_signals(signums)
+        if signum == signal.SIGHUP and self._socket is not None:
+            pid = spawn_reload([self._socket.fileno()])
+            logging.info('Reloading, new process %d' % pid)
+        yield self.shutdown(timeout, pools)
+        get_scheduler().stop()
+
 #            if self.ssl_options is not None:
 #                assert ssl, "Python 2.6+ and OpenSSL required for SSL"
 #                connection = ssl.wrap_socket(
@@ -67,6 +144,35 @@ class HTTPServer(object):
 #            except:
 #                logging.error("Error in connection callback", exc_info=True)
 
+    def serve(self, port, address="", num_processes=None, reuse_port=False, exception_handler=None,
+              drain_timeout=30, pools=()):
+        """Pre-fork worker processes and serve in every worker, never returns.
+        
+        Every worker runs its own Scheduler main loop, the supervisor parent process
+        restarts the crashed workers. Don't create the Scheduler before call this.
+        SIGTERM the supervisor stops the workers gracefully, see shutdown(),
+        SIGHUP reloads with a new copy of the process first, see litchi.process.fork_processes().
+        
+        @param num_processes: the number of workers, None means the number of CPUs.
+        @param reuse_port: if True, every worker listens its own SO_REUSEPORT socket and the kernel
+            balances the connections; otherwise all workers share the listening socket created before fork.
+        @param exception_handler: pass to Scheduler.mainloop().
+        @param drain_timeout: seconds for the in-flight requests to finish on stop.
+        @param pools: the litchi.pool.Pool to close on stop.
+        """
+        if not reuse_port:
+            self.listen(port, address)
+        # with reuse_port, the new process listens its own sockets, nothing to inherit
+        fork_processes(num_processes, inherit_fds=[self._socket.fileno()] if self._socket else ())
+        if reuse_port:
+            self.listen(port, address, reuse_port=True)
+        scheduler = get_scheduler()
+        scheduler.new(self.start(), 'HTTPServer', priority=PRIORITY_HIGH) # keep accepting under overload
+        # the supervisor does the reload
+        scheduler.new(self.stop_on_signals(drain_timeout, pools, reload=False), 'HTTPServerSignals')
+        scheduler.mainloop(exception_handler)
+        sys.exit(0)
+
 
 class HTTPConnection(object):
     """Handles a connection to an HTTP client, executing HTTP requests.
@@ -96,6 +202,10 @@ class HTTPConnection(object):
                 disconnect = True
         self._request = None
         return disconnect
+    
+    def idle(self):
+        """A keep-alive connection waiting for the next request."""
+        return self._request is None and not self.stream.buffered()
 
     def handler(self):
         try:
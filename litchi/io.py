@@ -2,7 +2,16 @@
 # -*- coding: utf-8 -*-
 """wrap the io select or epoll
 """
+import math
+import errno
 import select
+import weakref
+import threading
+
+
+# all the live hubs, an fd is closed for every hub, see forget()
+_hubs = weakref.WeakSet()
+_hubs_lock = threading.Lock() # the schedulers of the threads create the hubs
 
 
 class EventHub(object):
@@ -23,28 +32,55 @@ class EventHub(object):
     WRITE = _EPOLLOUT
     ERROR = _EPOLLERR | _EPOLLHUP | _EPOLLRDHUP
     
-    def __init__(self):
+    # the hub wakes up by more than the fds, e.g. the asyncio callbacks,
+    # the scheduler polls it even if no fd waited instead of sleeping
+    external = False
+    
+    def __init__(self, persistent=False):
+        """
+        @param persistent: if True, an fd stays registered after its events fired,
+            the scheduler only changes the interest when it changed,
+            and the fd must be removed by forget() before it close.
+        """
         self.fds = {}
+        self.persistent = persistent
+        with _hubs_lock:
+            _hubs.add(self)
         
     def poll(self, timeout=0):
         raise NotImplementedError()
     
-    def register(self, fd, events):
+    def register(self, fd, events, owner=None):
+        """Watch the fd for the events.
+        @param owner: the object of the fd, e.g. the socket. A hub caching the interest by fd
+            registers the fd again for another owner, the fd may be closed without forget()
+            and its number reused.
+        """
         self.fds[fd] = events
         
     def unregister(self, fd):
         del self.fds[fd]
+        
+    def discard(self, fd):
+        """Unregister the fd if it registered."""
+        if fd in self.fds:
+            self.unregister(fd)
     
     
 class SelectEventHub(EventHub):
     
-    def __init__(self):
-        super(SelectEventHub, self).__init__()
+    def __init__(self, persistent=False):
+        super(SelectEventHub, self).__init__(persistent)
         
     def poll(self, timeout=0):
         reads = (fd for fd, events in self.fds.iteritems() if events & self.READ)
         writes = (fd for fd, events in self.fds.iteritems() if events & self.WRITE)
-        r, w, e = select.select(reads, writes, self.fds, timeout)
+        try:
+            r, w, e = select.select(reads, writes, self.fds, timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR: # a signal, its handler has run
+                return []
+            raise
         eventpairs = []
         for fd in r:
             eventpairs.append((fd, self.READ))
@@ -59,30 +95,74 @@ class EPollEventHub(EventHub):
     """A epoll-based hub."""
     
     SIZE_HINT = 50000
-    def __init__(self):
-        super(EPollEventHub, self).__init__()
+    def __init__(self, persistent=False):
+        super(EPollEventHub, self).__init__(persistent)
         self.epoll = select.epoll(self.SIZE_HINT)
+        self.owners = {} # fd: the weakref to its owner, see register()
         
     def poll(self, timeout=0):
         if timeout is None:
             timeout = -1
-        return self.epoll.poll(timeout)
+        elif timeout > 0:
+            # epoll works in milliseconds and truncates, round up to avoid wake up too early
+            timeout = math.ceil(timeout * 1000) / 1000.0
+        try:
+            return self.epoll.poll(timeout)
+        except IOError, e:
+            if e.errno == errno.EINTR: # a signal, its handler has run
+                return []
+            raise
     
-    def register(self, fd, events):
-        if fd not in self.fds:
-            self.epoll.register(fd, events | self.ERROR)
-        else:
-            self.epoll.modify(fd, events | self.ERROR)
+    def register(self, fd, events, owner=None):
+        current = self.fds.get(fd)
+        if current == events and (owner is None or self._owned(fd, owner)):
+            return # interest not change, no syscall
+        try:
+            if current is None:
+                self.epoll.register(fd, events | self.ERROR)
+            else:
+                self.epoll.modify(fd, events | self.ERROR)
+        except IOError, e:
+            # the fd had been closed and reused without forget(), epoll already dropped it
+            if e.errno == errno.ENOENT:
+                self.epoll.register(fd, events | self.ERROR)
+            elif e.errno == errno.EEXIST:
+                self.epoll.modify(fd, events | self.ERROR)
+            else:
+                raise
         super(EPollEventHub, self).register(fd, events)
+        if owner is not None:
+            try:
+                self.owners[fd] = weakref.ref(owner)
+            except TypeError: # not weak referable, the fd is registered again every wait
+                self.owners.pop(fd, None)
+        
+    def _owned(self, fd, owner):
+        ref = self.owners.get(fd)
+        return ref is not None and ref() is owner
         
     def unregister(self, fd):
         super(EPollEventHub, self).unregister(fd)
-        self.epoll.unregister(fd)
+        self.owners.pop(fd, None)
+        try:
+            self.epoll.unregister(fd)
+        except IOError, e:
+            # already closed, epoll removed it automatically
+            if e.errno not in (errno.ENOENT, errno.EBADF):
+                raise
         
         
-def get_hub():
+def get_hub(persistent=False):
     try:
-        hub = EPollEventHub()
+        hub = EPollEventHub(persistent)
     except:
-        hub = SelectEventHub()
-    return hub
\ No newline at end of file
+        hub = SelectEventHub(persistent)
+    return hub
+
+
+def forget(fd):
+    """Remove the fd from every hub, MUST be called before the fd close."""
+    with _hubs_lock:
+        hubs = list(_hubs)
+    for hub in hubs:
+        hub.discard(fd)
\ No newline at end of file
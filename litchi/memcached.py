@@ -7,11 +7,15 @@ import sys
 
 from litchi.utils import memcache
 from litchi.socketwrap import Socket
+from litchi.systemcall import RunInThread
 
 
 
 class AsyncClient(memcache.Client):
     
+    # decompress the values larger than this in the thread pool, zlib releases the GIL
+    thread_decompress_len = 64 * 1024
+    
     def set_servers(self, servers):
         """
         Set the pool of servers used by this client.
@@ -522,7 +526,10 @@ class AsyncClient(memcache.Client):
             buf = buf[:-2]  # strip \r\n
 
         if flags & memcache.Client._FLAG_COMPRESSED:
-            buf = memcache.decompress(buf)
+            if len(buf) >= self.thread_decompress_len:
+                buf = yield RunInThread(memcache.decompress, buf)
+            else:
+                buf = memcache.decompress(buf)
 
 
         if  flags == 0 or flags == memcache.Client._FLAG_COMPRESSED:
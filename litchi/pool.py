@@ -2,64 +2,96 @@
 # -*- coding: utf-8 -*-
 """A simple pool.
 """
-from collections import deque
+import time
+import logging
+from types import GeneratorType
 
-from litchi.systemcall import Wait, Fire
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
+from litchi.sync import Queue
+from litchi.systemcall import TimeoutError
 
 
 class Pool(object):
     """A simple pool."""
     
-    FREE_CONN_EVENT = '__FREE_CONN_EVENT__'
-    
     def __init__(self, connect, minsize=5, maxsize=10, *args, **kwargs):
         self.connect = connect
-        self.free_items = deque()
+        self.free_items = Queue() # hands the put back connection over to the first waiting get()
         if minsize > maxsize:
             minsize = maxsize
         self.minsize = minsize
         self.maxsize = maxsize
         self.connected_count = 0
+        self.closed = False
         self.args = args
         self.kwargs = kwargs
-        self.waittings = 0
-        self.wait_event = '%s_%s' % (self.FREE_CONN_EVENT, id(self))
         
-        # init pool
-        Scheduler.instance().new(self.init(), 'PoolInit')
+        # init pool, in the current scheduler of the thread
+        get_scheduler().new(self.init(), 'PoolInit')
+    
+    @property
+    def waittings(self):
+        """The number of the tasks waiting for a free connection."""
+        return self.free_items.getters.waiting()
     
     def _connect(self):
         self.connected_count += 1
-        conn = yield self.connect(*self.args, **self.kwargs)
+        try:
+            conn = yield self.connect(*self.args, **self.kwargs)
+        except BaseException: # failed or killed, TaskCancelled isn't an Exception
+            self.connected_count -= 1
+            raise
         yield conn
         
     def init(self):
         if self.connected_count == 0 and self.minsize > 0:
             for _ in range(self.minsize):
                 conn = yield self._connect()
-                self.free_items.append(conn)
+                yield self.free_items.put(conn)
     
-    def get(self):
-        if self.free_items:
-            conn = self.free_items.popleft()
-        elif self.connected_count < self.maxsize:
+    def get(self, timeout=None):
+        """Get a connection, put it back in a finally block, it runs even if the task killed:
+        
+        conn = yield pool.get()
+        try:
+            ...
+        finally:
+            yield pool.put(conn)
+        
+        @param timeout: seconds to wait for a free connection, or litchi.systemcall.TimeoutError will be raised.
+        """
+        if self.closed:
+            raise RuntimeError('%r closed' % self)
+        if not self.free_items and self.connected_count < self.maxsize:
             conn = yield self._connect()
         else:
-            self.waittings += 1
-            conn = yield Wait(self.wait_event)
+            conn = yield self.free_items.get(timeout)
         yield conn
     
     def put(self, conn):
-        if self.waittings > 0:
-            self.waittings -= 1
-            yield Fire(self.wait_event, conn)
-        else:
-            if len(self.free_items) < self.maxsize:
-                self.free_items.appendleft(conn)
-            else:
-                del conn
+        yield self.free_items.put(conn)
+        
+    def close(self, timeout=None):
+        """Close all the connections, wait for the used ones to be put back at most timeout seconds.
+        A connection is closed by its close() or disconnect_all() (memcache clients),
+        which can be a coroutine. get() raises RuntimeError after closed.
+        """
+        self.closed = True
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.connected_count:
+            try:
+                conn = yield self.free_items.get(None if deadline is None else max(0, deadline - time.time()))
+            except TimeoutError:
+                logging.warning('%r: %d connections not put back in %ss' % (
+                    self, self.connected_count, timeout))
+                break
+            self.connected_count -= 1
+            close = getattr(conn, 'close', None) or getattr(conn, 'disconnect_all', None)
+            if close is not None:
+                result = close()
+                if type(result) is GeneratorType:
+                    yield result
                 
     def __repr__(self):
         return '<Pool connected: %d, free: %d, waitting: %d, min: %d, max: %d >' % \
-            (self.connected_count, len(self.free_items), self.waittings, self.minsize, self.maxsize)
\ No newline at end of file
+            (self.connected_count, len(self.free_items), self.waittings, self.minsize, self.maxsize)
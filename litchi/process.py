@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Multi-process utilities, pre-fork workers and supervise them.
+
+A Scheduler only uses one core, run one Scheduler per worker process to use all of them.
+The Scheduler MUST be created in the worker, after fork_processes() returned.
+
+Reload without a gap in accepting: spawn_reload() starts a new copy of the process which
+inherits the listening sockets, it gets them by inherited_socket(), the connections
+queue in the shared socket's backlog while the old process stops accepting and drains.
+"""
+import os
+import sys
+import time
+import errno
+import fcntl
+import signal
+import socket
+import logging
+
+from litchi.systemcall import ReadWait
+from litchi.io import forget
+
+# the fds inherited from the reloaded process, comma separated
+INHERIT_FDS_ENV = 'LITCHI_INHERIT_FDS'
+
+_inherited = None # the inherited fds not taken yet
+
+
+def cpu_count():
+    """Returns the number of processors on this machine."""
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        pass
+    try:
+        return os.sysconf('SC_NPROCESSORS_CONF')
+    except (AttributeError, ValueError):
+        pass
+    return 1
+
+
+def fork_processes(num_processes=None, max_restarts=100, inherit_fds=()):
+    """Fork num_processes worker processes, and supervise them in the parent.
+    
+    Returns the worker id (0 ~ num_processes - 1) in the workers.
+    The parent never returns: it restarts the crashed workers (killed by signal or exit status not 0),
+    and exits when all workers exit normally. SIGTERM or SIGINT the parent will SIGTERM all workers,
+    and exit after they exit, they can finish their work gracefully.
+    SIGHUP the parent reloads: spawn_reload(inherit_fds) first, then stops like SIGTERM.
+    
+    @param num_processes: the number of workers, None or <= 0 means the number of CPUs.
+    @param max_restarts: the parent gives up if restart workers more than this times.
+    @param inherit_fds: the fds the reloaded process inherits, e.g. the listening socket.
+    """
+    if num_processes is None or num_processes <= 0:
+        num_processes = cpu_count()
+    children = {} # pid: worker id
+    
+    def start_child(i):
+        pid = os.fork()
+        if pid == 0:
+            # the worker, reset the supervisor's signal handlers
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            return i
+        children[pid] = i
+        return None
+    
+    for i in range(num_processes):
+        worker_id = start_child(i)
+        if worker_id is not None:
+            return worker_id
+    logging.info('Started %d worker processes: %r' % (num_processes, children.keys()))
+    
+    def kill_children():
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    
+    stopping = []
+    def terminate(signum, frame):
+        if not stopping:
+            stopping.append(signum)
+            kill_children()
+            
+    def reload(signum, frame):
+        if not stopping:
+            pid = spawn_reload(inherit_fds)
+            logging.info('Reloading, new process %d, stopping the old workers' % pid)
+            terminate(signum, frame)
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    signal.signal(signal.SIGHUP, reload)
+    
+    restarts = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        if pid not in children:
+            continue
+        worker_id = children.pop(pid)
+        if stopping: # don't restart
+            continue
+        if os.WIFSIGNALED(status):
+            logging.warning('worker %d (pid %d) killed by signal %d, restarting' % 
+                            (worker_id, pid, os.WTERMSIG(status)))
+        elif os.WEXITSTATUS(status) != 0:
+            logging.warning('worker %d (pid %d) exited with status %d, restarting' % 
+                            (worker_id, pid, os.WEXITSTATUS(status)))
+        else:
+            logging.info('worker %d (pid %d) exited normally' % (worker_id, pid))
+            continue
+        restarts += 1
+        if restarts > max_restarts:
+            kill_children()
+            raise RuntimeError('Too many worker restarts, give up')
+        time.sleep(0.1) # don't restart a worker crashing on start too fast
+        if stopping: # signalled while sleeping
+            continue
+        if start_child(worker_id) is not None:
+            return worker_id
+        if stopping: # signalled while forking, before the child was recorded
+            kill_children()
+    sys.exit(0)
+
+
+def spawn_reload(fds=()):
+    """Start a new copy of this process, the same command line, which inherits the fds.
+    @param fds: e.g. the listening sockets, the new process gets them by inherited_socket().
+    @return: the pid of the new process.
+    """
+    env = dict(os.environ)
+    env[INHERIT_FDS_ENV] = ','.join(str(fd) for fd in fds)
+    for fd in fds: # keep them open over exec
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) & ~fcntl.FD_CLOEXEC)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execve(sys.executable, [sys.executable] + sys.argv, env)
+        finally:
+            os._exit(127)
+    return pid
+
+
+def inherited_socket(port):
+    """Take the listening socket on the port inherited from the reloaded process.
+    @return: the socket, or None if no such socket inherited.
+    """
+    global _inherited
+    if _inherited is None:
+        _inherited = [int(fd) for fd in os.environ.pop(INHERIT_FDS_ENV, '').split(',') if fd]
+    for fd in _inherited:
+        sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM) # a dup
+        if sock.getsockname()[1] == port:
+            _inherited.remove(fd)
+            os.close(fd)
+            return sock
+        sock.close()
+    return None
+
+
+def wait_signals(signums):
+    """Wait in the task until one of the signals received, in the main thread only.
+    The handlers of the signals are replaced while waiting, the mainloop is woken
+    by signal.set_wakeup_fd().
+    
+    signum = yield wait_signals([signal.SIGTERM, signal.SIGINT])
+    
+    @return: the signum received.
+    """
+    received = []
+    def handler(signum, frame):
+        received.append(signum)
+    reader, writer = socket.socketpair()
+    reader.setblocking(0)
+    writer.setblocking(0)
+    previous = [(signum, signal.signal(signum, handler)) for signum in signums]
+    previous_fd = signal.set_wakeup_fd(writer.fileno())
+    try:
+        while not received:
+            yield ReadWait(reader)
+            try:
+                reader.recv(64)
+            except socket.error:
+                pass
+    finally:
+        signal.set_wakeup_fd(previous_fd)
+        for signum, old in previous:
+            signal.signal(signum, old)
+        forget(reader.fileno())
+        reader.close()
+        writer.close()
+    yield received[0]
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A worker process pool, run the CPU-bound calls on the other cores.
+
+Every worker process talks with the scheduler through a socketpair, the call and its result
+are pickled and sent in chunks, the scheduler side waits the socket with ReadWait/WriteWait,
+so a big payload never blocks the scheduler.
+"""
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import struct
+import resource
+import logging
+from collections import deque
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from litchi.systemcall import ReadWait, WriteWait, TaskCancelled
+from litchi.process import cpu_count
+from litchi.io import forget
+
+CHUNK_SIZE = 64 * 1024
+_HEADER = struct.Struct('!I')
+
+
+class WorkerDied(RuntimeError):
+    """The worker process died when running the call."""
+
+
+def _recvall(sock, size):
+    chunks = []
+    while size:
+        data = sock.recv(min(size, CHUNK_SIZE))
+        if not data:
+            raise EOFError('scheduler closed')
+        chunks.append(data)
+        size -= len(data)
+    return ''.join(chunks)
+
+def _worker_main(sock):
+    """The worker process, run the calls one by one until the scheduler close the socket."""
+    while True:
+        try:
+            size, = _HEADER.unpack(_recvall(sock, _HEADER.size))
+            func, args, kwargs = pickle.loads(_recvall(sock, size))
+        except EOFError:
+            return
+        try:
+            result = (True, func(*args, **kwargs))
+        except:
+            result = (False, sys.exc_info()[1])
+        try:
+            payload = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except:
+            error = sys.exc_info()[1]
+            payload = pickle.dumps((False, pickle.PicklingError('%r: %s' % (result[1], error))), 
+                                   pickle.HIGHEST_PROTOCOL)
+        sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+class _Worker(object):
+    
+    CLOSE_GRACE = 0.1 # seconds for the worker to exit after the socket closed, then it is killed
+    
+    def __init__(self):
+        parent, child = socket.socketpair()
+        self.pid = os.fork()
+        if self.pid == 0:
+            # close all the fds inherited from the scheduler, except the socket
+            fd = child.fileno()
+            maxfd = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+            if maxfd == resource.RLIM_INFINITY:
+                maxfd = 65536
+            os.closerange(3, fd)
+            os.closerange(fd + 1, maxfd)
+            try:
+                _worker_main(child)
+            finally:
+                os._exit(0)
+        child.close()
+        parent.setblocking(0)
+        self.sock = parent
+        self.calls = 0
+        
+    def close(self):
+        """Close the socket, the worker exits when it reads the EOF, then reap it.
+        A worker still running a call is killed after CLOSE_GRACE.
+        """
+        forget(self.sock.fileno())
+        self.sock.close()
+        deadline = time.time() + self.CLOSE_GRACE
+        try:
+            while os.waitpid(self.pid, os.WNOHANG)[0] == 0:
+                if time.time() >= deadline:
+                    os.kill(self.pid, signal.SIGKILL)
+                    os.waitpid(self.pid, 0)
+                    break
+                time.sleep(0.001)
+        except OSError: # reaped already
+            pass
+        
+    def __repr__(self):
+        return '<_Worker pid: %d, calls: %d>' % (self.pid, self.calls)
+
+
+class ProcessPool(object):
+    """A worker process pool, the processes fork on demand.
+    
+    The functions, arguments and results MUST be picklable.
+    """
+    
+    def __init__(self, size=None, start_task=None):
+        """
+        @param size: the max number of worker processes, None means the number of CPUs.
+        @param start_task: start_task(coroutine) runs the coroutine as a new task,
+            the pool drives every busy worker by a task.
+        """
+        self.size = size or cpu_count()
+        self.start_task = start_task
+        self.workers = []
+        self.idle = deque()
+        self.queue = deque() # the jobs waiting for a free worker
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0 # from submit to get the result
+        self.max_latency = 0.0
+        self.total_queue_time = 0.0 # waiting for a free worker
+        
+    def submit(self, job, func, args, kwargs, callback):
+        """Run func(*args, **kwargs) in a worker process, callback(job, result, error) when it's done,
+        error is sys.exc_info() like tuple or None.
+        """
+        item = (job, func, args, kwargs, callback, time.time())
+        if self.idle:
+            worker = self.idle.popleft()
+        elif len(self.workers) < self.size:
+            worker = self._spawn()
+        else:
+            self.queue.append(item)
+            return
+        self.start_task(self._run(worker, item))
+    
+    def _spawn(self):
+        worker = _Worker()
+        self.workers.append(worker)
+        return worker
+    
+    def _run(self, worker, item):
+        """Send the jobs to the worker one by one, until no job queued."""
+        while item is not None:
+            job, func, args, kwargs, callback, submitted = item
+            start = time.time()
+            try:
+                payload = pickle.dumps((func, args, kwargs), pickle.HIGHEST_PROTOCOL)
+            except:
+                self.errors += 1
+                callback(job, None, sys.exc_info())
+                item = self.queue.popleft() if self.queue else None
+                continue
+            try:
+                yield self._send(worker.sock, _HEADER.pack(len(payload)) + payload)
+                size, = _HEADER.unpack((yield self._recv(worker.sock, _HEADER.size)))
+                ok, result = pickle.loads((yield self._recv(worker.sock, size)))
+            except (EOFError, socket.error), e:
+                self._worker_died(worker, item, e)
+                return
+            except TaskCancelled:
+                # the scheduler kills the task waiting on a hung up fd
+                self._worker_died(worker, item, 'hung up')
+                raise
+            worker.calls += 1
+            self.calls += 1
+            latency = time.time() - submitted
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.total_queue_time += start - submitted
+            if ok:
+                callback(job, result, None)
+            else:
+                self.errors += 1
+                callback(job, None, (type(result), result, None))
+            item = self.queue.popleft() if self.queue else None
+        self.idle.append(worker)
+        
+    def _worker_died(self, worker, item, reason):
+        logging.error('process pool worker %d died: %s' % (worker.pid, reason))
+        self.workers.remove(worker)
+        worker.close()
+        self.calls += 1
+        self.errors += 1
+        error = WorkerDied('worker %d died: %s' % (worker.pid, reason))
+        item[4](item[0], None, (WorkerDied, error, None))
+        if self.queue: # the queued jobs need a new worker
+            self.start_task(self._run(self._spawn(), self.queue.popleft()))
+        
+    def _send(self, sock, data):
+        offset = 0
+        while offset < len(data):
+            yield WriteWait(sock)
+            try:
+                offset += sock.send(buffer(data, offset, CHUNK_SIZE))
+            except socket.error, e:
+                if e.errno != errno.EAGAIN:
+                    raise
+    
+    def _recv(self, sock, size):
+        chunks = []
+        while size:
+            yield ReadWait(sock)
+            try:
+                data = sock.recv(min(size, CHUNK_SIZE))
+            except socket.error, e:
+                if e.errno == errno.EAGAIN:
+                    continue
+                raise
+            if not data:
+                raise EOFError('connection closed')
+            chunks.append(data)
+            size -= len(data)
+        yield ''.join(chunks)
+        
+    def stats(self):
+        """The pool size, queue depth and per-call latency, to help size the pool."""
+        return {
+            'size': self.size,
+            'workers': len(self.workers),
+            'busy': len(self.workers) - len(self.idle),
+            'queued': len(self.queue),
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_latency': self.calls and self.total_latency / self.calls,
+            'max_latency': self.max_latency,
+            'avg_queue_time': self.calls and self.total_queue_time / self.calls,
+        }
+        
+    def close(self):
+        """Close the idle workers, they exit when the socket closed."""
+        while self.idle:
+            worker = self.idle.popleft()
+            self.workers.remove(worker)
+            worker.close()
+    
+    def __repr__(self):
+        return '<ProcessPool %r>' % self.stats()
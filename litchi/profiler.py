@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A sampling profiler which knows the coroutine trampolining.
+
+A coroutine called by yield runs under Task.run, not under its caller, so the real
+stack only has the innermost coroutine. The profiler samples the mainloop thread,
+rebuilds the logical stack of the running task: the task name, the coroutines in
+Task.trampolining_stack, then the real frames from the running coroutine, and
+counts the samples in the collapsed stack format of flamegraph.pl / speedscope:
+
+    httphandler;handler (http.py:135);_on_headers (http.py:166);parse (http.py:310) 42
+
+The samples out of any task are under [scheduler], e.g. [scheduler];_poll;_iopoll.
+
+profiler = Profiler()
+profiler.start() # in the mainloop thread
+...
+profiler.stop()
+profiler.write('litchi.collapsed')
+
+Or run a script under the profiler, the output is written when the script exit:
+$ python -m litchi.profiler -o litchi.collapsed examples/helloworld.py
+$ flamegraph.pl litchi.collapsed > litchi.svg
+"""
+import os
+import sys
+import signal
+import threading
+import optparse
+from collections import defaultdict
+
+from litchi.schedule import Task, Scheduler
+
+_TASK_RUN = Task.run.im_func.func_code
+_LOOP = Scheduler._loop.im_func.func_code
+_labels = {} # code: label
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                               code.co_firstlineno)
+    return label
+
+
+class Profiler(threading.Thread):
+    """Sample the logical stack of the running task every interval seconds."""
+
+    def __init__(self, interval=0.005, thread=None):
+        """
+        @param interval: seconds between two samples.
+        @param thread: the ident of the mainloop thread, default the current thread.
+        """
+        super(Profiler, self).__init__(name='litchi-profiler')
+        self.daemon = True
+        self.interval = interval
+        self.loop_thread = thread if thread is not None else threading.current_thread().ident
+        self.samples = defaultdict(int) # stack tuple: count
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is not None:
+                stack = self.sample(frame)
+                if stack:
+                    self.samples[stack] += 1
+
+    def sample(self, frame):
+        """@return: the logical stack of the frame, the outermost first."""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            if code is _TASK_RUN:
+                task = frame.f_locals.get('self')
+                targets = list(task.trampolining_stack)
+                if not frames: # between two coroutine steps, the target isn't running
+                    targets.append(task.target)
+                stack = [task.name]
+                for target in targets:
+                    if target.gi_frame is not None:
+                        stack.append(_label(target.gi_frame.f_code))
+                stack.extend(_label(code) for code in reversed(frames))
+                return tuple(stack)
+            if code is _LOOP:
+                return ('[scheduler]',) + tuple(_label(code) for code in reversed(frames))
+            frames.append(code)
+            frame = frame.f_back
+        return None # the mainloop isn't running
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def collapsed(self):
+        """@return: the lines of stack and count, the most sampled first."""
+        return ['%s %d' % (';'.join(stack), count)
+                for stack, count in sorted(self.samples.iteritems(), key=lambda item: -item[1])]
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [-o output] [-i interval] script [args]')
+    parser.allow_interspersed_args = False
+    parser.add_option('-o', '--output', default='litchi.collapsed', help='the collapsed stacks file')
+    parser.add_option('-i', '--interval', type='float', default=0.005, help='seconds between two samples')
+    options, args = parser.parse_args()
+    if not args:
+        parser.error('no script to run')
+    sys.argv = args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args[0])))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # write the output on kill
+    profiler = Profiler(options.interval)
+    profiler.start()
+    try:
+        execfile(args[0], {'__name__': '__main__', '__file__': args[0]})
+    finally:
+        profiler.stop()
+        profiler.write(options.output)
+        print >> sys.stderr, '%d samples written to %s' % (sum(profiler.samples.itervalues()), options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,16 @@
 # -*- coding: utf-8 -*-
 """The core scheduler
 
-scheduler = Scheduler()
+scheduler = get_scheduler() # the current scheduler of the thread, or Scheduler()
 ...
 scheduler.new(task1)
 ...
 scheduler.new(taskn)
 scheduler.mainloop()
 
+Schedulers are independent, every thread can run its own mainloop. While a mainloop is
+running, it is the current scheduler of its thread, e.g. for the Pool created in a task.
+
        Design Discussion
 • Real operating systems have a strong notion of
   "protection" (e.g., memory protection)
@@ -22,36 +25,63 @@ scheduler.mainloop()
 """
 import sys
 import time
+import heapq
+import itertools
+import threading
 from types import GeneratorType
 import logging
-from collections import deque, defaultdict
+import warnings
+from collections import deque
 
-from litchi.utils.singleton import Singleton
-from litchi.systemcall import SystemCall
+from litchi.systemcall import systemcall_types, TimeoutError, TaskCancelled, ReadWait
 from litchi.io import get_hub
+from litchi.threadpool import ThreadPool
+from litchi.processpool import ProcessPool
+from litchi.stats import SchedulerStats
+from litchi.watchdog import WatchdogThread
+
+# the priority classes of the tasks, see _TaskQueue
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
 
 
 class Task(object):
     """A task"""
-    # use to create unique id
-    _taskid = 0
+    __slots__ = ('taskid', 'target', 'sendval', 'error', 'trampolining_stack', 'name', 
+                 'joinable', 'priority', 'result', 'exc_info', 'waiting', 'context', 'created')
+    # the unique ids, next() of a count is atomic, the schedulers of the threads share it
+    _taskids = itertools.count(1)
     
-    def __init__(self, target, name):
+    def __init__(self, target, name, joinable=False, priority=PRIORITY_NORMAL, context=None):
         """Init the task with target.
         @param target: target must be a coroutine(Generator).
+        @param joinable: keep the result after exit until WaitAll/WaitAny get it.
+        @param priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW.
+        @param context: the task-local context dict, None until the first set, see litchi.context.
         """
         assert isinstance(target, GeneratorType), 'target must be a Coroutine(Generator)'
-        Task._taskid += 1
-        self.taskid = Task._taskid
+        self.taskid = next(Task._taskids)
         self.target = target
         self.sendval = None
         self.error = None
         self.trampolining_stack = []
         self.name = name if name is not None else self.__class__.__name__
+        self.joinable = joinable
+        self.priority = priority
+        self.result = None # the last value the top target yielded
+        self.exc_info = None # the exception the task exit with
+        # how to stop the current waiting, (method, args...), see Scheduler.kill_tasks()
+        self.waiting = None
+        self.context = context
+        self.created = time.time()
         
     def close(self):
+        """Close the coroutines, the innermost first. They can't yield in their finally blocks,
+        Scheduler.kill_tasks() throws TaskCancelled instead.
+        """
         self.target.close()
-        for t in self.trampolining_stack:
+        for t in reversed(self.trampolining_stack):
             try:
                 t.close()
             except RuntimeError: # RuntimeError: generator ignored GeneratorExit
@@ -62,6 +92,7 @@ class Task(object):
         """Start the task.
         Implementation coroutine trampolining, detail please see ../examples/trampolining.py
         """
+        self.waiting = None # running, the last waiting is over
         while True:
             try:
                 if self.error is not None:
@@ -69,9 +100,10 @@ class Task(object):
                 else:
                     result = self.target.send(self.sendval) # start coroutine
                 self.error = None
-                if isinstance(result, SystemCall):
+                kind = type(result)
+                if kind in systemcall_types:
                     return result
-                if isinstance(result, GeneratorType): # coroutine trampolining
+                if kind is GeneratorType: # coroutine trampolining
                     # call suspendable coroutines
                     self.trampolining_stack.append(self.target)
                     self.sendval = None
@@ -87,6 +119,7 @@ class Task(object):
                 if not self.trampolining_stack: # top target, just raise, normal exit
                     raise
 #                self.sendval = None
+                self.error = None # the thrown error had been handled by the finished target
                 self.target = self.trampolining_stack.pop()
             except: # support try .. finally..
                 if not self.trampolining_stack:
@@ -94,28 +127,77 @@ class Task(object):
                 self.error = sys.exc_info()
                 self.target = self.trampolining_stack.pop()
     
+    def stack(self):
+        """The coroutines of the task, the outermost first.
+        @return: [(function name, filename, lineno)], the line is where the coroutine stopped.
+        """
+        frames = []
+        for target in self.trampolining_stack + [self.target]:
+            frame = target.gi_frame
+            if frame is not None: # None if the coroutine finished
+                frames.append((frame.f_code.co_name, frame.f_code.co_filename, frame.f_lineno))
+        return frames
+    
+    def format_stack(self):
+        return ''.join('  File "%s", line %d, in %s\n' % (filename, lineno, name) 
+                       for name, filename, lineno in self.stack())
+    
     def __repr__(self):
         return '<%s %d>' % (self.name, self.taskid)
 
 
 class _TaskQueue(object):
-    """"""
-    def __init__(self):
-        self.tasks = deque()
+    """The ready queue, a FIFO for every priority class.
+    
+    get() takes the tasks by weighted round robin: in a round every class can run
+    its weight of tasks, the higher class first, the round ends when all the classes
+    with tasks are out of turns. So a high task waits at most the turns of one round,
+    and the low tasks never starve. put and get are O(1), the classes are few.
+    """
+    def __init__(self, weights):
+        """
+        @param weights: the turns in a round of every priority class.
+        """
+        self.weights = weights
+        self.queues = [deque() for _ in weights]
+        self.turns = list(weights)
+        self.normal = self.queues[PRIORITY_NORMAL]
+        self.others = 0 # the tasks not in the normal class, if none, get() needn't round robin
         self.taskids = set()
         
     def put(self, task, first=False):
+        queue = self.queues[task.priority]
+        if queue is not self.normal:
+            self.others += 1
         if first:
-            self.tasks.appendleft(task)
+            queue.appendleft(task)
         else:
-            self.tasks.append(task)
+            queue.append(task)
         self.taskids.add(task.taskid)
         
     def get(self):
-        task = self.tasks.popleft()
+        if self.others:
+            task = self._round_robin()
+        else:
+            task = self.normal.popleft()
         self.taskids.remove(task.taskid)
         return task
     
+    def _round_robin(self):
+        turns = self.turns
+        for priority, queue in enumerate(self.queues):
+            if queue and turns[priority]:
+                break
+        else: # start a new round
+            turns[:] = self.weights
+            for priority, queue in enumerate(self.queues):
+                if queue:
+                    break
+        turns[priority] -= 1
+        if queue is not self.normal:
+            self.others -= 1
+        return queue.popleft()
+    
     def __len__(self):
         return len(self.taskids)
     
@@ -126,27 +208,207 @@ class _TaskQueue(object):
         return '%r' % self.taskids
 
 
-class Scheduler(Singleton):
+class _TimerQueue(object):
+    """A deadline ordered timer queue, base on binary heap.
+    
+    Every timer is a list [deadline, seq, callback, args], the seq keep the
+    timers with same deadline in FIFO order. Cancel a timer just mark it,
+    the heap will drop it lazily, so add, cancel and pop are all O(log n).
+    """
+    def __init__(self):
+        self.heap = []
+        self._seq = 0
+        self._cancelled = 0
+        
+    def add(self, deadline, callback, *args):
+        """Add a timer, callback(*args) will be called after the deadline.
+        @return: the timer, use to cancel it.
+        """
+        self._seq += 1
+        timer = [deadline, self._seq, callback, args]
+        heapq.heappush(self.heap, timer)
+        return timer
+    
+    def cancel(self, timer):
+        if timer[2] is not None:
+            timer[2] = timer[3] = None
+            self._cancelled += 1
+            # too many dead timers in the heap, rebuild it
+            if self._cancelled > 512 and self._cancelled > len(self.heap) >> 1:
+                heap = self.heap # in place, run_expired() may be popping it
+                heap[:] = [t for t in heap if t[2] is not None]
+                heapq.heapify(heap)
+                self._cancelled = 0
+    
+    def next_deadline(self):
+        """The earliest deadline, or None if no timer."""
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+        if heap:
+            return heap[0][0]
+        return None
+    
+    def run_expired(self, now):
+        """Call all the expired timers' callbacks."""
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)
+            callback = timer[2]
+            if callback is None:
+                self._cancelled -= 1
+                continue
+            timer[2] = None
+            callback(*timer[3])
+            
+    def __len__(self):
+        return len(self.heap) - self._cancelled
+    
+    def __repr__(self):
+        return '<_TimerQueue %d timers>' % len(self)
+
+
+class _WaitQueue(deque):
+    """A FIFO of the waiting tasks.
+    
+    cancel() only counts the task's entry as stale, the popped stale entries are skipped
+    by skip(): the entries of a task are in its waiting order, so the first one met is
+    the stale one. The stale entries are compacted when they are more than half of
+    the queue, so append, cancel and popleft are all O(1) amortized.
+    """
+    cancelled = None # taskid: stale entries
+    stale = 0
+    
+    def cancel(self, task):
+        if self.cancelled is None:
+            self.cancelled = {}
+        self.cancelled[task.taskid] = self.cancelled.get(task.taskid, 0) + 1
+        self.stale += 1
+        if self.stale > 64 and self.stale * 2 > len(self):
+            tasks = [t for t in self if not self.skip(t)]
+            self.clear()
+            self.extend(tasks)
+            
+    def skip(self, task):
+        """@return: True if the popped task's entry is stale."""
+        count = self.cancelled.get(task.taskid)
+        if not count:
+            return False
+        if count == 1:
+            del self.cancelled[task.taskid]
+        else:
+            self.cancelled[task.taskid] = count - 1
+        self.stale -= 1
+        return True
+        
+    def waiting(self):
+        return len(self) - self.stale
+    
+    def __repr__(self):
+        return '<_WaitQueue %r stale %d>' % (list(self), self.stale)
+
+
+class _Join(object):
+    """A task waiting for a group of tasks to exit, see Scheduler.join_tasks()."""
+    def __init__(self, task, taskids, wait_any):
+        self.task = task
+        self.taskids = taskids
+        self.wait_any = wait_any
+        self.results = {} # taskid: (result, exc_info)
+        self.pending = set()
+        
+    def __repr__(self):
+        return '<_Join %r waiting %r>' % (self.task, self.pending)
+
+
+_current = threading.local() # the current scheduler of the thread
+
+
+def get_scheduler():
+    """@return: the current scheduler of this thread: the one running its mainloop in the thread,
+    or set by set_scheduler(), or a new one created by the first call.
+    """
+    scheduler = getattr(_current, 'scheduler', None)
+    if scheduler is None:
+        scheduler = _current.scheduler = Scheduler()
+    return scheduler
+
+
+def set_scheduler(scheduler):
+    """Set the current scheduler of this thread, None to clear it."""
+    _current.scheduler = scheduler
+
+
+class Scheduler(object):
     """Schedule the task how to run."""
     
-    def __init__(self, debug=False):
-        self.ready = _TaskQueue() # the ready to run task queue
+    THREAD_POOL_SIZE = 10
+    PRIORITY_WEIGHTS = (16, 4, 1) # the turns in a round of the high, normal and low tasks
+    EVENT_SLOTS_SWEEP = 1024 # sweep the empty event slots when there are more
+    PROCESS_POOL_SIZE = None # the number of CPUs
+    
+    def __init__(self, debug=False, persistent_io=False, batch_size=None, batch_time=None, stats=False, hub=None):
+        """
+        @param persistent_io: keep the fds registered in the event hub for their lifetime,
+            only update the interest when it changed. All the fds MUST be closed by
+            litchi.socketwrap.Socket.close() or removed by litchi.io.forget() before close.
+        @param batch_size: run at most batch_size ready tasks between two I/O polls,
+            None means one pass of the ready queue.
+        @param batch_time: run the ready tasks at most batch_time seconds between two I/O polls,
+            None means no limit.
+        @param stats: collect the statistics of the tasks and the mainloop, see enable_stats().
+        @param hub: the EventHub, default epoll or select, e.g. litchi.asynciohub.AsyncioEventHub.
+        """
+        self.ready = _TaskQueue(self.PRIORITY_WEIGHTS) # the ready to run task queue
         self.taskmap = {} # the task dict for use taskid to find match task quickly
-        self.exit_waiting = {} # exit waiting tasks
+        self.exit_waiting = {} # exit waiting tasks and joins
+        self.exit_results = {} # the exited joinable tasks' results, taskid: (result, exc_info)
+        self.detached = set() # the joinable taskids left by a finished join, their results are dropped
         self.read_waiting = {} # read waiting tasks
         self.write_waiting = {}
-        self.sleep_waiting = {} # task sleeping
-        self.event_waitting = defaultdict(deque) # event waitting list
-        self.hub = get_hub()
-        self._start_sleep = False
+        self.sleep_waiting = {} # task sleeping, taskid: timer
+        self.timeout_waiting = {} # the timeout of the waiting tasks, taskid: timer
+        self.timers = _TimerQueue() # deadline ordered timers
+        self.event_waitting = {} # event: _WaitQueue, the empty ones are dropped by _sweep_events()
+        self._event_slots_limit = self.EVENT_SLOTS_SWEEP
+        self.hub = hub if hub is not None else get_hub(persistent_io)
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.thread_pool = None # create when the first RunInThread call
+        self.process_pool = None # create when the first RunInProcess call
+        self.stats = SchedulerStats() if stats else None
+        self.watchdog = None # the max seconds of a task step, see mainloop()
+        self.running = None # (task, start time) of the running step, while the watchdog is on
+        self.current = None # the task running its step, see litchi.context
+        self.stopping = False # see stop()
         self.debug = debug
         if self.debug:
             self.set_debug(debug)
             
+    @classmethod
+    def instance(cls, *args, **kwargs):
+        """Deprecated, the Scheduler isn't a singleton, use get_scheduler().
+        The arguments create the current scheduler if the thread has none, as before.
+        """
+        warnings.warn('Scheduler.instance() is deprecated, use get_scheduler()', DeprecationWarning, 2)
+        if getattr(_current, 'scheduler', None) is None:
+            _current.scheduler = cls(*args, **kwargs)
+        return _current.scheduler
+    
     def set_debug(self, debug):
         self.debug = debug
         logging.root.setLevel(logging.DEBUG)
         
+    def enable_stats(self, enabled=True):
+        """Start or stop collecting the statistics, see litchi.stats.
+        They can be switched while the mainloop running, self.stats is None when disabled.
+        """
+        if not enabled:
+            self.stats = None
+        elif self.stats is None:
+            self.stats = SchedulerStats()
+        
     def __repr__(self):
         return """
 taskmap: %r
@@ -160,14 +422,20 @@ event waitting: %r
 """ % (self.taskmap, self.ready, self.sleep_waiting, 
        self.read_waiting, self.write_waiting, self.exit_waiting, self.event_waitting) 
         
-    def new(self, target, taskname=None):
+    def new(self, target, taskname=None, joinable=False, priority=None, context=None):
         """Create a new task, Task's factory method.
         @param target: target must be a coroutine(Generator).
+        @param joinable: keep the result after exit until WaitAll/WaitAny get it.
+        @param priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW, None means normal.
+            Under overload, the high tasks like accept loops and health checks keep their latency.
+        @param context: the task-local context dict, see litchi.context.
         
         @return: the new task id.
         """
-        task = Task(target, taskname)
+        task = Task(target, taskname, joinable, PRIORITY_NORMAL if priority is None else priority, context)
         self.taskmap[task.taskid] = task
+        if self.stats is not None:
+            self.stats.new(task)
         self.schedule(task) # schedule the task to ready start
         return task.taskid
         
@@ -177,12 +445,33 @@ event waitting: %r
         """
         if task.taskid not in self.ready:
             self.ready.put(task, first)
+            if self.stats is not None:
+                self.stats.ready(task)
         
     def exit(self, task):
         del self.taskmap[task.taskid] # remove from task dict, because the task is dead.
+        if self.stats is not None:
+            self.stats.exit(task)
         # Notify other tasks waiting for exit
-        for task in self.exit_waiting.pop(task.taskid, []):
-            self.schedule(task)
+        joined = False
+        for waiter in self.exit_waiting.pop(task.taskid, []):
+            if isinstance(waiter, _Join):
+                joined = True
+                waiter.results[task.taskid] = (task.result, task.exc_info)
+                waiter.pending.discard(task.taskid)
+                if waiter.wait_any or not waiter.pending:
+                    self._finish_join(waiter)
+            else:
+                self.schedule(waiter)
+        detached = self.detached and task.taskid in self.detached
+        if detached:
+            self.detached.remove(task.taskid)
+        if task.joinable and not joined:
+            if detached: # nobody will join it
+                if task.exc_info is not None and not issubclass(task.exc_info[0], TaskCancelled):
+                    logging.error('%r exited with an exception nobody joined' % task, exc_info=task.exc_info)
+            else: # keep it for the later join
+                self.exit_results[task.taskid] = (task.result, task.exc_info)
         if self.debug:
             logging.debug('%s terminated\n%r' % (task, self))
     
@@ -190,28 +479,162 @@ event waitting: %r
         """task waitting another task to exit"""
         if wait_taskid in self.taskmap:
             self.exit_waiting.setdefault(wait_taskid, []).append(task)
+            task.waiting = (self._stop_exit_wait, wait_taskid)
             return True
         return False
     
-    def wait_for_read(self, task, fd):
+    def _stop_exit_wait(self, task, wait_taskid):
+        waiters = self.exit_waiting.get(wait_taskid)
+        if waiters and task in waiters:
+            waiters.remove(task)
+            if not waiters:
+                del self.exit_waiting[wait_taskid]
+        self.schedule(task)
+    
+    def join_tasks(self, task, taskids, wait_any=False, timeout=None):
+        """task waiting for all (or any) of the tasks to exit, and get their results.
+        The tasks exited before, only the joinable ones' results can be got, others' result is None.
+        """
+        join = _Join(task, list(taskids), wait_any)
+        for taskid in join.taskids:
+            if taskid in self.taskmap:
+                join.pending.add(taskid)
+            else:
+                join.results[taskid] = self.exit_results.pop(taskid, (None, None))
+                if wait_any:
+                    break
+        if not join.pending or (wait_any and join.results):
+            self._finish_join(join)
+            return
+        for taskid in join.pending:
+            self.exit_waiting.setdefault(taskid, []).append(join)
+        task.waiting = (self._stop_join_wait, join)
+        if timeout is not None:
+            self.timeout_waiting[task.taskid] = self.timers.add(time.time() + timeout, 
+                self._join_timeout, join, timeout)
+        
+    def _stop_join(self, join):
+        """Stop the join waiting for its pending tasks, e.g. the losers of WaitAny,
+        those not waited by others any more are detached, their results are not kept.
+        """
+        for taskid in join.pending:
+            waiters = self.exit_waiting.get(taskid)
+            if waiters and join in waiters:
+                waiters.remove(join)
+                if not waiters:
+                    del self.exit_waiting[taskid]
+            task = self.taskmap.get(taskid)
+            if task is not None and task.joinable and taskid not in self.exit_waiting:
+                self.detached.add(taskid)
+                    
+    def _stop_join_wait(self, task, join):
+        self._stop_join(join)
+        self.schedule(task)
+        
+    def _finish_join(self, join):
+        """Give the results to the joining task, or throw the first error into it."""
+        self._stop_join(join)
+        task = join.task
+        self._cancel_timeout(task)
+        if task.taskid not in self.taskmap: # killed
+            return
+        results = join.results
+        if join.wait_any:
+            taskid = [t for t in join.taskids if t in results][0]
+            result, exc_info = results[taskid]
+            if exc_info is not None:
+                task.error = exc_info
+            else:
+                task.sendval = (taskid, result)
+        else:
+            for taskid in join.taskids:
+                exc_info = results[taskid][1]
+                if exc_info is not None:
+                    task.error = exc_info
+                    break
+            else:
+                task.sendval = [results[taskid][0] for taskid in join.taskids]
+        self.schedule(task)
+        
+    def _join_timeout(self, join, timeout):
+        del self.timeout_waiting[join.task.taskid]
+        self._stop_join(join)
+        task = join.task
+        task.error = (TimeoutError, TimeoutError('%d tasks not exit after %ss' % (len(join.pending), timeout)), None)
+        self.schedule(task)
+    
+    def wait_for_read(self, task, fd, timeout=None, owner=None):
+        """@param owner: the object of the fd, e.g. the socket, see EventHub.register()."""
         self.read_waiting[fd] = task
-        self.hub.register(fd, self.hub.READ)
+        task.waiting = (self._stop_io_wait, fd, self.read_waiting)
+        self.hub.register(fd, self.hub.fds.get(fd, self.hub.NONE) | self.hub.READ, owner)
+        if timeout is not None:
+            self.timeout_waiting[task.taskid] = self.timers.add(time.time() + timeout, 
+                self._io_timeout, task, fd, self.read_waiting, 'ReadWait', timeout)
     
-    def wait_for_write(self, task, fd):
+    def wait_for_write(self, task, fd, timeout=None, owner=None):
         self.write_waiting[fd] = task
-        self.hub.register(fd, self.hub.WRITE)
+        task.waiting = (self._stop_io_wait, fd, self.write_waiting)
+        self.hub.register(fd, self.hub.fds.get(fd, self.hub.NONE) | self.hub.WRITE, owner)
+        if timeout is not None:
+            self.timeout_waiting[task.taskid] = self.timers.add(time.time() + timeout, 
+                self._io_timeout, task, fd, self.write_waiting, 'WriteWait', timeout)
+            
+    def _io_timeout(self, task, fd, waiting, call, timeout):
+        """The I/O waiting timeout, stop waiting and throw TimeoutError into the task."""
+        del self.timeout_waiting[task.taskid]
+        del waiting[fd]
+        if not self.hub.persistent: # persistent interest will be dropped by the idle event
+            self._update_interest(fd)
+        task.error = (TimeoutError, TimeoutError('%s fd %d timeout after %ss' % (call, fd, timeout)), None)
+        self.schedule(task)
+        
+    def _stop_io_wait(self, task, fd, waiting):
+        if waiting.get(fd) is task: # not woken by the poll yet
+            del waiting[fd]
+            self._update_interest(fd)
+        self.schedule(task)
+        
+    def _cancel_timeout(self, task):
+        timer = self.timeout_waiting.pop(task.taskid, None)
+        if timer is not None:
+            self.timers.cancel(timer)
+        
+    def _update_interest(self, fd):
+        """Watch the fd for the events its waiting tasks want, one reader and one writer at most."""
+        events = self.hub.NONE
+        if fd in self.read_waiting:
+            events |= self.hub.READ
+        if fd in self.write_waiting:
+            events |= self.hub.WRITE
+        if events:
+            self.hub.register(fd, events)
+        elif fd in self.hub.fds:
+            self.hub.unregister(fd)
     
     def kill_tasks(self, taskids):
-        """Kill tasks"""
+        """Cancel the tasks: stop their waiting wherever they wait, the fds are removed
+        from the hub, then TaskCancelled is thrown into the innermost coroutine.
+        It unwinds outward through the finally blocks, which can still yield, e.g. to put
+        a connection back to the pool. The task exits when TaskCancelled reaches the top.
+        @return: the killed taskids.
+        """
         killids = []
         for taskid in taskids:
             task = self.taskmap.get(taskid, None)
             if task:
-                task.close() # close task
+                timer = self.sleep_waiting.pop(taskid, None)
+                if timer is not None:
+                    self.timers.cancel(timer)
+                self._cancel_timeout(task)
                 killids.append(taskid) # tell the caller if success kill
-                # not in the ready queue, add to, make sure the target raise StopIteration
-                if taskid not in self.ready: 
+                task.error = (TaskCancelled, TaskCancelled('%r cancelled' % task), None)
+                waiting = task.waiting
+                if waiting is None: # running, ready or sleeping
                     self.schedule(task)
+                else: # the stop method schedules it
+                    task.waiting = None
+                    waiting[0](task, *waiting[1:])
         return killids
     
     def _iopoll(self, timeout=None):
@@ -219,102 +642,347 @@ event waitting: %r
         When the timeout argument is omitted the function blocks until at least one file descriptor is ready. 
         A time-out value of zero specifies a poll and never blocks."""
         error_tasks, error_fds = [], []
-        if self.read_waiting or self.write_waiting:
-            eventpairs = self.hub.poll(timeout)
-            READ = self.hub.READ
-            WRITE = self.hub.WRITE
-            ERROR = self.hub.ERROR
+        hub = self.hub
+        if self.read_waiting or self.write_waiting or hub.external:
+            eventpairs = hub.poll(timeout)
+            if self.stats is not None:
+                self.stats.polled(len(eventpairs))
+            READ = hub.READ
+            WRITE = hub.WRITE
+            ERROR = hub.ERROR
+            persistent = hub.persistent
+            timeout_waiting = self.timeout_waiting
             for fd, events in eventpairs:
-                self.hub.unregister(fd)
                 if events & ERROR:
+                    hub.unregister(fd)
                     if fd in self.read_waiting:
                         error_tasks.append(self.read_waiting.pop(fd))
                     if fd in self.write_waiting:
                         error_tasks.append(self.write_waiting.pop(fd))
                     error_fds.append((fd, '0x%X' % events))
+                    continue
+                idle = hub.NONE # the events nobody waiting for
+                if events & READ:
+                    task = self.read_waiting.pop(fd, None)
+                    if task is None:
+                        idle |= READ
+                    else:
+                        if timeout_waiting:
+                            self._cancel_timeout(task)
+                        self.schedule(task)
+                if events & WRITE:
+                    task = self.write_waiting.pop(fd, None)
+                    if task is None:
+                        idle |= WRITE
+                    else:
+                        if timeout_waiting:
+                            self._cancel_timeout(task)
+                        self.schedule(task)
+                if persistent:
+                    # the registration outlives the wait, stop watching the idle events
+                    if idle:
+                        events = hub.fds[fd] & ~idle
+                        if events:
+                            hub.register(fd, events)
+                        else:
+                            hub.unregister(fd)
                 else:
-                    if events & READ:
-                        self.schedule(self.read_waiting.pop(fd))
-                    if events & WRITE:
-                        self.schedule(self.write_waiting.pop(fd))
+                    # keep watching for the other direction's waiting task
+                    self._update_interest(fd)
         if error_tasks and self.debug:
             logging.debug('io error events: %s\n%r' % (zip(error_tasks, error_fds), self))
         return error_tasks
                 
-    def _io_task(self):
-        while True:
-            if len(self.ready) == 0 and not self.sleep_waiting: # only io waiting
-                error_tasks = self._iopoll(None) # blocks until at least one file descriptor is ready
-            else:
-                error_tasks = self._iopoll(0) # a poll and never blocks
+    def _poll(self, block=True):
+        """Poll the I/O events and wake up the expired timers.
+        If no task is ready and block, blocks until the next timer deadline or I/O event.
+        @return: False if all tasks are blocked and nothing can wake them up.
+        """
+        timeout = None
+        if self.ready or not block:
+            timeout = 0
+        else:
+            deadline = self.timers.next_deadline()
+            if deadline is not None:
+                timeout = max(0, deadline - time.time())
+        if self.read_waiting or self.write_waiting or self.hub.external:
+            error_tasks = self._iopoll(timeout)
             if error_tasks:
-                self.kill_tasks((t.taskid for t in error_tasks))
-            yield
+                self.kill_tasks([t.taskid for t in error_tasks])
+        elif timeout is None: # nothing ready, no I/O and no timer
+            return False
+        elif timeout > 0: # only timers waiting
+            time.sleep(timeout)
+        if self.timers:
+            self.timers.run_expired(time.time())
+        return True
     
-    def _check_sleeping_tasks(self):
-        """Check sleeping tasks"""
-        while True:
-            if self.sleep_waiting:
-                now = time.time()
-                wakeups = []
-                for taskid, (start_time, seconds) in self.sleep_waiting.iteritems():
-                    if now - start_time > seconds:
-                        # wake up the task
-                        wakeups.append(taskid)
-                for taskid in wakeups:
-                    task = self.taskmap[taskid]
-                    self.schedule(task)
-                    del self.sleep_waiting[taskid]
-            yield
+    def _wakeup(self, task):
+        del self.sleep_waiting[task.taskid]
+        self.schedule(task)
     
     def wait_for_sleep(self, task, seconds):
-        if not self._start_sleep:
-            self.new(self._check_sleeping_tasks(), 'CheckSleepTask') # start sleep check
-            self._start_sleep = True
-        self.sleep_waiting[task.taskid] = (time.time(), seconds)
+        self.sleep_waiting[task.taskid] = self.timers.add(time.time() + seconds, self._wakeup, task)
         
-    def wait_for_event(self, task, event):
-        self.event_waitting[event].append(task)
+    def wait_in_queue(self, task, queue, timeout=None, what='wait', on_timeout=None):
+        """Let the task wait in the _WaitQueue, until wake_queue() or pop_queue() get it.
+        @param timeout: seconds, then the task is removed from the queue, 
+            TimeoutError('<what> timeout after <timeout>s') will be thrown into it.
+        @param on_timeout: on_timeout(scheduler, task) is called instead of scheduling the task,
+            when it stops waiting by the timeout or by kill_tasks().
+        """
+        queue.append(task)
+        task.waiting = (self._stop_queue_wait, queue, on_timeout)
+        if timeout is not None:
+            self.timeout_waiting[task.taskid] = self.timers.add(time.time() + timeout, 
+                self._queue_timeout, task, queue, what, timeout, on_timeout)
+            
+    def _queue_timeout(self, task, queue, what, timeout, on_timeout):
+        del self.timeout_waiting[task.taskid]
+        task.waiting = None
+        task.error = (TimeoutError, TimeoutError('%s timeout after %ss' % (what, timeout)), None)
+        self._stop_queue_wait(task, queue, on_timeout)
         
-    def fire_event(self, event, value):
-#        if event not in self.event_waitting:
-#            return
-        tasks = self.event_waitting[event]
-        if tasks:
-#            print tasks
-            task = tasks.popleft()
+    def _stop_queue_wait(self, task, queue, on_timeout):
+        queue.cancel(task)
+        if on_timeout is not None:
+            on_timeout(self, task)
+        else:
+            self.schedule(task)
+            
+    def pop_queue(self, queue):
+        """Remove the first waiting task from the _WaitQueue and stop its timeout.
+        @return: the task, None if no task waiting.
+        """
+        while queue:
+            task = queue.popleft()
+            if queue.stale and queue.skip(task):
+                continue
+            task.waiting = None
+            if self.timeout_waiting:
+                self._cancel_timeout(task)
+            return task
+        return None
+    
+    def wake_queue(self, queue, value=None, on_cancel=None):
+        """Wake up the first waiting task of the _WaitQueue with the value.
+        @param on_cancel: on_cancel(scheduler, task, value) is called if the task is killed
+            before it runs and gets the value, e.g. to hand a lock over to the next waiter.
+        @return: the task, None if no task waiting.
+        """
+        task = self.pop_queue(queue)
+        if task is not None:
+            task.sendval = value
+            if on_cancel is not None:
+                task.waiting = (self._stop_woken, on_cancel, value)
+            self.schedule(task)
+        return task
+    
+    def _stop_woken(self, task, on_cancel, value):
+        on_cancel(self, task, value)
+        self.schedule(task)
+        
+    def wait_for_event(self, task, event, timeout=None):
+        queue = self.event_waitting.get(event)
+        if queue is None:
+            if len(self.event_waitting) >= self._event_slots_limit:
+                self._sweep_events()
+            queue = self.event_waitting[event] = _WaitQueue()
+        self.wait_in_queue(task, queue, timeout, 'Wait event %r' % (event,) if timeout is not None else None)
+        
+    def fire_event(self, event, value, broadcast=False):
+        """Wake up the first task waiting for the event, or all of them if broadcast.
+        @return: the number of the tasks woken up.
+        """
+        queue = self.event_waitting.get(event)
+        if queue is None:
+            return 0
+        woken = 0
+        while queue:
+            task = queue.popleft()
+            if queue.stale and queue.skip(task):
+                continue
+            task.waiting = None
+            if self.timeout_waiting:
+                self._cancel_timeout(task)
             task.sendval = value
-            self.schedule(task, True)
-#            for task in tasks:
-#                task.sendval = value
-#                self.schedule(task, True)
+            woken += 1
+            if not broadcast:
+                self.schedule(task, True) # hand over to the waiter at once
+                break
+            self.schedule(task) # keep the waiting order
+        return woken
+    
+    def _sweep_events(self):
+        """Drop the event slots no task waiting for. The slots are kept after fired,
+        the events fired repeatedly needn't create them again, this sweep keeps the slots
+        at most twice of the waited events, so the unique event keys don't grow the memory.
+        """
+        waiting = self.event_waitting
+        for event in [event for event, queue in waiting.iteritems() if not queue.waiting()]:
+            del waiting[event]
+        self._event_slots_limit = max(self.EVENT_SLOTS_SWEEP, 2 * len(waiting))
     
-    def mainloop(self, exception_handler=None):
-        """start main loop
+    def run_in_thread(self, task, func, args, kwargs):
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPool(self.THREAD_POOL_SIZE)
+        if not self.thread_pool.pending: # start collect the finished jobs
+            self.new(self._collect_thread_jobs(), 'ThreadPoolTask', priority=PRIORITY_HIGH)
+        job = [task] # the task is dropped from it if killed
+        task.waiting = (self._stop_job_wait, job)
+        self.thread_pool.submit(job, func, args, kwargs)
+        
+    def _collect_thread_jobs(self):
+        """Wait for the finished jobs, give their results to the tasks, exit when no job pending."""
+        pool = self.thread_pool
+        while pool.pending:
+            yield ReadWait(pool)
+            for job, result, error in pool.collect():
+                self._resume(job, result, error)
+                
+    def run_in_process(self, task, func, args, kwargs):
+        if self.process_pool is None:
+            self.process_pool = ProcessPool(self.PROCESS_POOL_SIZE, 
+                                            lambda runner: self.new(runner, 'ProcessPoolTask', priority=PRIORITY_HIGH))
+        job = [task]
+        task.waiting = (self._stop_job_wait, job)
+        self.process_pool.submit(job, func, args, kwargs, self._resume)
+        
+    def _stop_job_wait(self, task, job):
+        job[0] = None # the call can't be stopped, drop its result
+        self.schedule(task)
+            
+    def _resume(self, job, result, error):
+        """Give the result of the offloaded call to the task, or throw the error into it."""
+        task = job[0]
+        if task is None: # killed
+            return
+        if error is not None:
+            task.error = error
+        else:
+            task.sendval = result
+        self.schedule(task)
+    
+    def mainloop(self, exception_handler=None, watchdog=None, watchdog_thread=False):
+        """start main loop, it returns when all the tasks exit or stop() called.
         exception_handler: exception hanlder, if exception raise, will pass sys.exc_info() info to exception_handler;
             if exception_handler return True, mainloop will let ignore the exception. 
             Otherwise, mainloop raise the exception.
+        @param watchdog: seconds, log the task and its coroutines if a step of the task run longer,
+            a blocking call or a long loop between two yields freezes all the other tasks.
+        @param watchdog_thread: watch the steps in a thread too, it logs the stack of
+            a task still running over the watchdog seconds, where it stuck.
         """
-        # schedule io task, launch I/O polls
-        self.new(self._io_task(), 'IOTask')
+        self.watchdog = watchdog
+        thread = None
+        if watchdog is not None and watchdog_thread:
+            thread = WatchdogThread(self, watchdog)
+            thread.start()
+        previous = getattr(_current, 'scheduler', None)
+        _current.scheduler = self
+        self.stopping = False
+        try:
+            self._loop(exception_handler)
+        finally:
+            if previous is not None: # keep self current if there was none
+                _current.scheduler = previous
+            self.watchdog = None
+            self.running = None
+            self.current = None
+            if thread is not None:
+                thread.stop()
+                
+    def stop(self):
+        """Let the mainloop return after the running batch, even if some tasks left,
+        e.g. after the graceful shutdown.
+        """
+        self.stopping = True
         
-        while self.taskmap:
-            task = self.ready.get()
+    def _step_start(self, task):
+        now = time.time()
+        if self.stats is not None:
+            self.stats.run_start(task, now)
+        if self.watchdog is not None:
+            self.running = (task, now)
+        return now
+    
+    def _step_end(self, task, started, call=None):
+        now = time.time()
+        if self.stats is not None:
+            self.stats.run_end(task, started, now, call)
+        if self.watchdog is not None:
+            self.running = None
+            if now - started > self.watchdog:
+                logging.warning('%r blocked the loop for %.1fms, the coroutines:\n%s' % (
+                    task, (now - started) * 1000, task.format_stack()))
+    
+    def _loop(self, exception_handler):
+        while self.taskmap and not self.stopping:
+            self.current = None # the timer callbacks run out of any task
+            # poll I/O once, harvest all the ready fds, then drain the ready queue within the budget
+            if not self._poll():
+                logging.error('all tasks are blocked, nothing can wake them up\n%r' % self)
+                break
+            self._run_ready(exception_handler)
+            
+    def run_once(self, exception_handler=None):
+        """One iteration of the mainloop without blocking: poll the I/O, run the expired timers,
+        then a batch of the ready tasks. For another event loop to drive the scheduler,
+        see litchi.asynciohub.
+        """
+        self.current = None
+        self._poll(False)
+        self._run_ready(exception_handler)
+        self.current = None
+            
+    def _run_ready(self, exception_handler):
+        ready = self.ready
+        stats = self.stats
+        if stats is not None:
+            stats.loop(len(ready))
+        timed = stats is not None or self.watchdog is not None
+        budget = len(ready) if self.batch_size is None else self.batch_size
+        batch_time = self.batch_time
+        if batch_time is not None:
+            deadline = time.time() + batch_time
+        while budget > 0 and ready:
+            budget -= 1
+            if batch_time is not None and time.time() >= deadline:
+                break
+            task = ready.get()
+            self.current = task
+            if timed:
+                started = self._step_start(task)
             try:
                 result = task.run()
-                if isinstance(result, SystemCall): # if systemcall, let call to handle it
-                    result.task = task
-                    result.scheduler = self
-                    result.handle()
+                if type(result) in systemcall_types: # if systemcall, let call to handle it
+                    result.handle(self, task)
                 else:
+                    task.result = result
                     self.schedule(task)
+                if timed:
+                    self._step_end(task, started, result)
             except StopIteration:
+                if timed:
+                    self._step_end(task, started)
+                self.exit(task)
+                continue
+            except TaskCancelled: # killed, unwound to the top
+                if timed:
+                    self._step_end(task, started)
+                if task.joinable:
+                    task.exc_info = sys.exc_info()
                 self.exit(task)
                 continue
             except KeyboardInterrupt:
                 raise
             except:
-                if exception_handler and exception_handler(*sys.exc_info()):
+                if timed:
+                    self._step_end(task, started)
+                if task.joinable: # the joining task will get the exception
+                    task.exc_info = sys.exc_info()
+                    self.exit(task)
+                elif exception_handler and exception_handler(*sys.exc_info()):
                     self.exit(task)
                 else:
                     raise
@@ -4,9 +4,11 @@
 
 Using the 'Coroutine Trampolining' magic.
 """
+import time
 import socket
 
 from litchi.systemcall import ReadWait, WriteWait
+from litchi.io import forget
 
 
 _socketmethods = (
@@ -14,60 +16,140 @@ _socketmethods = (
     'getpeername', 'getsockname', 'getsockopt', 'setsockopt',
     'sendall', 'setblocking',
     'settimeout', 'gettimeout', 'shutdown',
-    'dup', 'makefile', 'close')
+    'dup', 'makefile')
+
+def _deadline(timeout):
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return max(0, deadline - time.time())
+
 
 class Socket(object):
-    """A non-blocking socket warp class. It only support TCP, not work at UDP currently."""
+    """A non-blocking socket warp class. It only support TCP, not work at UDP currently.
+    
+    The read data is kept in a bytearray, _read_buffer[_read_start:_read_end], received by
+    recv_into the free space after it. The consumed head is only dropped when it is larger
+    than the data left, so a multi-MB read copies every byte a constant times.
+    """
+    
+    # keep the read buffer to reuse when all consumed, unless it grew larger
+    READ_BUFFER_KEEP = 65536
+    
     def __init__(self, family=socket.AF_INET, type=socket.SOCK_STREAM, proto=0, _sock=None):
         if _sock is not None:
             self.sock = _sock
         else:
             self.sock = socket.socket(family, type, proto)
         self.sock.setblocking(0)
-        self._read_buffer = ''
+        self._read_buffer = bytearray()
+        self._read_start = 0
+        self._read_end = 0
+        self._read_wait = ReadWait(self.sock) # reused by the waits without timeout
         self
         
     def accept(self):
-        yield ReadWait(self.sock)
+        yield self._read_wait
         client, addr = self.sock.accept()
         yield Socket(_sock=client), addr
         
-    def send(self, buffer):
+    def send(self, buffer, timeout=None):
+        """Send all the buffer.
+        @param timeout: seconds to send all, or litchi.systemcall.TimeoutError will be raised.
+        """
+        deadline = _deadline(timeout)
         sent = len(buffer)
         while buffer:
-            yield WriteWait(self.sock)
+            yield WriteWait(self.sock, _remaining(deadline))
             length = self.sock.send(buffer)
             buffer = buffer[length:]
         yield sent
     
-    def read_until(self, delimiter):
-        """yield the result until socket read the given delimiter."""
+    def read_until(self, delimiter, timeout=None):
+        """yield the result until socket read the given delimiter.
+        @param timeout: seconds to read the delimiter, or litchi.systemcall.TimeoutError will be raised.
+        """
+        deadline = _deadline(timeout)
+        searched = 0 # the buffered data before it has no delimiter, not scanned again
         while True:
-            loc = self._read_buffer.find(delimiter)
+            start = self._read_start
+            loc = self._read_buffer.find(delimiter, start + searched, self._read_end)
             if loc != -1:
-                yield self._consume(loc + len(delimiter))
+                yield self._consume(loc + len(delimiter) - start)
                 break
-            yield self.recv()
+            searched = max(0, self._read_end - start - len(delimiter) + 1)
+            yield self._fill(8192, _remaining(deadline))
             
-    def read_bytes(self, num_bytes, flags=0):
+    def read_bytes(self, num_bytes, flags=0, timeout=None):
+        """yield num_bytes data.
+        @param timeout: seconds to read all the data, or litchi.systemcall.TimeoutError will be raised.
+        """
+        deadline = _deadline(timeout)
         while True:
-            if len(self._read_buffer) >= num_bytes:
+            buffered = self._read_end - self._read_start
+            if buffered >= num_bytes:
                 yield self._consume(num_bytes)
                 break
-            yield self.recv(flags=flags)
+            # receive the rest at once, the buffer grows to the size needed
+            yield self._fill(max(8192, num_bytes - buffered), _remaining(deadline))
+        
+    def buffered(self):
+        """@return: the number of the bytes read and not consumed yet."""
+        return self._read_end - self._read_start
         
     def _consume(self, loc):
-        result = self._read_buffer[:loc]
-        self._read_buffer = self._read_buffer[loc:]
+        start = self._read_start
+        result = memoryview(self._read_buffer)[start:start + loc].tobytes()
+        start += loc
+        if start == self._read_end: # all consumed, reuse the buffer from the head
+            start = self._read_end = 0
+            if len(self._read_buffer) > self.READ_BUFFER_KEEP:
+                self._read_buffer = bytearray()
+        self._read_start = start
         return result
     
-    def recv(self, size=8192, flags=0):
-        yield ReadWait(self.sock)
-#            self._read_buffer += self.sock.recv(size, flags)
-        self._read_buffer += self.sock.recv(size)
-        yield self._read_buffer
-#            if self._read_buffer:
-#                yield self._read_buffer
+    def _fill(self, size, timeout=None):
+        """Wait for readable, then recv_into the buffer at most size bytes.
+        @return: the number of the bytes received, 0 at EOF.
+        """
+        yield self._read_wait if timeout is None else ReadWait(self.sock, timeout)
+        buf = self._read_buffer
+        start, end = self._read_start, self._read_end
+        if len(buf) - end < size:
+            if start and start >= end - start: # compact when the consumed head is the larger part
+                del buf[:start]
+                end -= start
+                self._read_start = start = 0
+            free = len(buf) - end
+            if free < size: # at least double, amortized
+                buf.extend(bytearray(max(size - free, len(buf))))
+        view = memoryview(buf)[end:end + size]
+        try:
+            received = self.sock.recv_into(view, size)
+        finally:
+            del view # the bytearray can't resize while exported
+        self._read_end = end + received
+        yield received
+    
+    def recv(self, size=8192, flags=0, timeout=None):
+        """Receive at most size bytes into the read buffer.
+        @return: all the data in the buffer, it is not consumed.
+        """
+        yield self._fill(size, timeout)
+        yield memoryview(self._read_buffer)[self._read_start:self._read_end].tobytes()
+            
+    def close(self):
+        """Close the socket, and remove it from the event hubs first."""
+        try:
+            fd = self.sock.fileno()
+        except socket.error: # already closed
+            return
+        forget(fd)
+        self.sock.close()
             
     def __repr__(self):
         try:
@@ -85,7 +167,7 @@ class Socket(object):
     
     def __del__(self):
         try:
-            self.sock.close()
+            self.close()
         except:
             # close() may fail if __init__ didn't complete
             pass
@@ -5,6 +5,7 @@
 import os
 
 from litchi.web import HTTPNotFound
+from litchi.systemcall import RunInThread
 
 types = {
     'html': 'text/html',
@@ -105,16 +106,24 @@ types = {
 }
 
 
+def _read_file(filepath):
+    """Read the whole file, return None if it not exists."""
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
 class StaticHandler(object):
-    """Static file handler"""
+    """Static file handler, the file is read in the scheduler's thread pool."""
     def __init__(self, root):
         self.root = root
         
     def __call__(self, request):
         path = request.path
         filepath = os.path.join(self.root, path[1:])
-        if not os.path.exists(filepath):
+        data = yield RunInThread(_read_file, filepath)
+        if data is None:
             yield HTTPNotFound()
         ext = path.split('.')[-1].lower()
-        with open(filepath, 'rb') as f:
-            yield f.read(), types.get(ext, None)
\ No newline at end of file
+        yield data, types.get(ext, None)
\ No newline at end of file
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Scheduler statistics, per task name and for the mainloop.
+
+scheduler = get_scheduler()
+scheduler.enable_stats()
+...
+print scheduler.stats.format() # or scheduler.stats.snapshot() for a dict
+
+For every task name: how many times the tasks ran, the total and max wall time
+spent in Task.run, and the time waiting in each queue. A task waits in 'ready'
+when it can run, or in the queue of the system call it yielded: 'read', 'write',
+'sleep', 'event', 'join', 'thread', 'process' or 'queue' (Lock, Semaphore,
+Condition and Queue of litchi.sync).
+For the mainloop: iterations, I/O polls, events per poll and the ready queue length.
+"""
+import time
+import signal
+import logging
+
+from litchi.systemcall import Sleep, ReadWait, WriteWait, Wait, WaitTask, WaitAll, WaitAny, \
+    RunInThread, RunInProcess
+
+# the queue a task waits in after yielding the system call
+QUEUES = {
+    Sleep: 'sleep',
+    ReadWait: 'read',
+    WriteWait: 'write',
+    Wait: 'event',
+    WaitTask: 'join',
+    WaitAll: 'join',
+    WaitAny: 'join',
+    RunInThread: 'thread',
+    RunInProcess: 'process',
+}
+
+
+class _NameStats(object):
+    """The statistics of the tasks with the same name."""
+    __slots__ = ('tasks', 'runs', 'run_time', 'run_max', 'waits')
+
+    def __init__(self):
+        self.tasks = 0
+        self.runs = 0
+        self.run_time = 0.0
+        self.run_max = 0.0
+        self.waits = {} # queue: seconds
+
+    def as_dict(self):
+        return dict(tasks=self.tasks, runs=self.runs, run_time=self.run_time, run_max=self.run_max,
+                    run_avg=self.run_time / self.runs if self.runs else 0.0, waits=dict(self.waits))
+
+
+class SchedulerStats(object):
+    """Collected by the Scheduler while enabled, see Scheduler.enable_stats()."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.names = {} # task name: _NameStats
+        self.waiting = {} # taskid: (queue, since), the queue None means running
+        self.iterations = 0
+        self.polls = 0
+        self.events = 0
+        self.max_events = 0
+        self.ready_total = 0
+        self.max_ready = 0
+
+    def _name(self, task):
+        stats = self.names.get(task.name)
+        if stats is None:
+            stats = self.names[task.name] = _NameStats()
+        return stats
+
+    def new(self, task):
+        self._name(task).tasks += 1
+
+    def ready(self, task):
+        """The task put into the ready queue, end its waiting."""
+        now = time.time()
+        previous = self.waiting.get(task.taskid)
+        if previous is not None and previous[0] is not None:
+            queue, since = previous
+            waits = self._name(task).waits
+            waits[queue] = waits.get(queue, 0.0) + now - since
+        self.waiting[task.taskid] = ('ready', now)
+
+    def run_start(self, task, now):
+        previous = self.waiting.get(task.taskid)
+        if previous is not None and previous[0] == 'ready':
+            waits = self._name(task).waits
+            waits['ready'] = waits.get('ready', 0.0) + now - previous[1]
+        self.waiting[task.taskid] = (None, now)
+
+    def run_end(self, task, started, now, call=None):
+        """Account the run, the task starts waiting for the call if it isn't ready again.
+        @param call: the system call the task yielded, None if it didn't.
+        """
+        elapsed = now - started
+        stats = self._name(task)
+        stats.runs += 1
+        stats.run_time += elapsed
+        if elapsed > stats.run_max:
+            stats.run_max = elapsed
+        if self.waiting.get(task.taskid, ('ready',))[0] is None: # not scheduled during the run
+            self.waiting[task.taskid] = (QUEUES.get(type(call), 'other'), now)
+
+    def exit(self, task):
+        self.waiting.pop(task.taskid, None)
+
+    def loop(self, ready):
+        self.iterations += 1
+        self.ready_total += ready
+        if ready > self.max_ready:
+            self.max_ready = ready
+
+    def polled(self, events):
+        self.polls += 1
+        self.events += events
+        if events > self.max_events:
+            self.max_events = events
+
+    def snapshot(self):
+        """@return: a dict of all the statistics."""
+        return dict(
+            elapsed=time.time() - self.started,
+            tasks=dict((name, stats.as_dict()) for name, stats in self.names.iteritems()),
+            loop=dict(iterations=self.iterations, polls=self.polls, events=self.events,
+                      events_per_poll=float(self.events) / self.polls if self.polls else 0.0,
+                      max_events=self.max_events, max_ready=self.max_ready,
+                      ready_avg=float(self.ready_total) / self.iterations if self.iterations else 0.0))
+
+    def format(self):
+        """@return: a text report, the task names sorted by the total run time."""
+        snapshot = self.snapshot()
+        lines = ['elapsed %.3fs, loop: %s' % (snapshot['elapsed'], ' '.join(
+            '%s=%s' % (k, round(v, 3) if isinstance(v, float) else v) for k, v in sorted(snapshot['loop'].iteritems())))]
+        lines.append('%-24s %8s %10s %10s %10s %10s  %s' % (
+            'name', 'tasks', 'runs', 'total_ms', 'avg_us', 'max_ms', 'waits_ms'))
+        for name, stats in sorted(snapshot['tasks'].iteritems(), key=lambda item: -item[1]['run_time']):
+            waits = ' '.join('%s=%.1f' % (queue, seconds * 1000) for queue, seconds in sorted(stats['waits'].iteritems()))
+            lines.append('%-24s %8d %10d %10.1f %10.1f %10.2f  %s' % (
+                name, stats['tasks'], stats['runs'], stats['run_time'] * 1000, stats['run_avg'] * 1e6,
+                stats['run_max'] * 1000, waits))
+        return '\n'.join(lines)
+
+
+def log_on_signal(scheduler, signum=signal.SIGUSR1):
+    """Log the scheduler's statistics when the process receive the signal,
+    e.g. $ kill -USR1 <pid>
+    """
+    def handler(signum, frame):
+        if scheduler.stats is None:
+            logging.info('scheduler stats are disabled')
+        else:
+            logging.info('scheduler stats\n%s' % scheduler.stats.format())
+    signal.signal(signum, handler)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Synchronization primitives for tasks: Lock, Semaphore, Condition and Queue.
+
+Every operation returns a system call, the task yields it:
+
+lock = Lock()
+def task():
+    yield lock.acquire()
+    ...
+    yield lock.release()
+
+queue = Queue(100)
+def producer():
+    yield queue.put(item) # blocks while the queue is full
+def consumer():
+    item = yield queue.get()
+
+The waiting tasks are woken in FIFO order, a released lock or semaphore is handed over
+to the first waiting task directly, so a new comer can't take it first. The blocking
+operations accept a timeout in seconds, TimeoutError will be thrown into the task
+if it expired. Waking a task is O(1).
+
+A killed task is removed from the waiting, and a lock, a semaphore or an item handed
+over to a task killed before it runs is handed over to the next waiting task again.
+"""
+from collections import deque
+
+from litchi.systemcall import SystemCall
+from litchi.schedule import _WaitQueue
+from litchi.stats import QUEUES
+
+
+class _Call(SystemCall):
+    """Call the primitive's method with the scheduler and the task."""
+    __slots__ = ('method', 'args')
+
+    def __init__(self, method, *args):
+        self.method = method
+        self.args = args
+
+    def handle(self, scheduler, task):
+        self.method(scheduler, task, *self.args)
+
+QUEUES[_Call] = 'queue' # the waits of the primitives, in the statistics
+
+
+def _raise(scheduler, task, error):
+    """Throw the error into the task."""
+    task.error = (type(error), error, None)
+    scheduler.schedule(task)
+
+
+class Lock(object):
+    """A lock owned by a task, only the owner can release it."""
+
+    def __init__(self):
+        self.owner = None # the owner's taskid
+        self.waiters = _WaitQueue()
+
+    def acquire(self, timeout=None):
+        return _Call(self._acquire, timeout)
+
+    def release(self):
+        return _Call(self._release)
+
+    def locked(self):
+        return self.owner is not None
+
+    def _acquire(self, scheduler, task, timeout):
+        if self.owner is None:
+            self.owner = task.taskid
+            task.sendval = True
+            scheduler.schedule(task, True)
+        elif self.owner == task.taskid:
+            _raise(scheduler, task, RuntimeError('%r already holds %r' % (task, self)))
+        else:
+            scheduler.wait_in_queue(task, self.waiters, timeout, 'acquire %r' % self)
+
+    def _release(self, scheduler, task):
+        if self.owner != task.taskid:
+            _raise(scheduler, task, RuntimeError('%r release %r not held' % (task, self)))
+            return
+        self._hand_over(scheduler)
+        scheduler.schedule(task, True)
+
+    def _hand_over(self, scheduler, *args):
+        """Give the lock to the first waiting task, or unlock it.
+        It's the on_cancel too, the lock is handed over again if the new owner killed.
+        """
+        waiter = scheduler.wake_queue(self.waiters, True, self._hand_over)
+        self.owner = waiter.taskid if waiter is not None else None
+
+    def _grant(self, scheduler, task):
+        """Give the lock to the task which is already woken, or let it wait without timeout."""
+        if self.owner is None:
+            self.owner = task.taskid
+            scheduler.schedule(task)
+        else:
+            scheduler.wait_in_queue(task, self.waiters)
+
+    def __repr__(self):
+        return '<Lock owner %s waiting %d>' % (self.owner, self.waiters.waiting())
+
+
+class Semaphore(object):
+    """A counter of the available resources, acquire() takes one, release() gives one back."""
+
+    def __init__(self, value=1):
+        if value < 0:
+            raise ValueError('semaphore initial value must be >= 0')
+        self.value = value
+        self.waiters = _WaitQueue()
+
+    def acquire(self, timeout=None):
+        return _Call(self._acquire, timeout)
+
+    def release(self):
+        return _Call(self._release)
+
+    def _acquire(self, scheduler, task, timeout):
+        if self.value > 0:
+            self.value -= 1
+            task.sendval = True
+            scheduler.schedule(task, True)
+        else:
+            scheduler.wait_in_queue(task, self.waiters, timeout, 'acquire %r' % self)
+
+    def _release(self, scheduler, task):
+        self._give(scheduler)
+        scheduler.schedule(task, True)
+
+    def _give(self, scheduler, *args):
+        """Hand over to the first waiting task, also when the woken one killed."""
+        if scheduler.wake_queue(self.waiters, True, self._give) is None: # no one waiting, keep it
+            self.value += 1
+
+    def __repr__(self):
+        return '<Semaphore value %d waiting %d>' % (self.value, self.waiters.waiting())
+
+
+class Condition(object):
+    """Wait in the lock until notified.
+
+    yield condition.acquire()
+    while not ready():
+        yield condition.wait()
+    ...
+    yield condition.release()
+
+    wait() releases the lock, the notified task waits the lock again without the timeout.
+    """
+
+    def __init__(self, lock=None):
+        self.lock = lock if lock is not None else Lock()
+        self.waiters = _WaitQueue()
+
+    def acquire(self, timeout=None):
+        return self.lock.acquire(timeout)
+
+    def release(self):
+        return self.lock.release()
+
+    def wait(self, timeout=None):
+        """The task get True after notified and holds the lock again.
+        If timeout seconds passed, TimeoutError will be raised after the lock acquired again.
+        """
+        return _Call(self._wait, timeout)
+
+    def notify(self, n=1):
+        """Wake up at most n waiting tasks, the task get the number of the woken."""
+        return _Call(self._notify, n)
+
+    def notify_all(self):
+        return _Call(self._notify, None)
+
+    def _wait(self, scheduler, task, timeout):
+        lock = self.lock
+        if lock.owner != task.taskid:
+            _raise(scheduler, task, RuntimeError('%r wait on %r without the lock' % (task, self)))
+            return
+        lock._hand_over(scheduler)
+        scheduler.wait_in_queue(task, self.waiters, timeout, 'wait %r' % self, self._wait_timeout)
+
+    def _wait_timeout(self, scheduler, task):
+        """Timeout, the TimeoutError raise after the task holds the lock again."""
+        self.lock._grant(scheduler, task)
+
+    def _notify(self, scheduler, task, n):
+        lock = self.lock
+        if lock.owner != task.taskid:
+            _raise(scheduler, task, RuntimeError('%r notify %r without the lock' % (task, self)))
+            return
+        woken = 0
+        while n is None or woken < n:
+            waiter = scheduler.pop_queue(self.waiters)
+            if waiter is None:
+                break
+            waiter.sendval = True
+            scheduler.wait_in_queue(waiter, lock.waiters) # move to the lock waiting
+            woken += 1
+        task.sendval = woken
+        scheduler.schedule(task, True)
+
+    def __repr__(self):
+        return '<Condition %r waiting %d>' % (self.lock, self.waiters.waiting())
+
+
+class Queue(object):
+    """A FIFO queue, put() blocks while the queue is full, get() blocks while it is empty.
+    The item is handed over to the first waiting getter directly.
+    """
+
+    def __init__(self, maxsize=None):
+        """
+        @param maxsize: None or 0 means not limited.
+        """
+        self.maxsize = maxsize
+        self.items = deque()
+        self.getters = _WaitQueue()
+        self.putters = _WaitQueue()
+        self.putting = {} # the waiting putters' items, taskid: item
+
+    def put(self, item, timeout=None):
+        return _Call(self._put, item, timeout)
+
+    def get(self, timeout=None):
+        """The task get the item."""
+        return _Call(self._get, timeout)
+
+    def qsize(self):
+        return len(self.items)
+
+    __len__ = qsize
+
+    def empty(self):
+        return not self.items
+
+    def full(self):
+        return bool(self.maxsize) and len(self.items) >= self.maxsize
+
+    def _put(self, scheduler, task, item, timeout):
+        if scheduler.wake_queue(self.getters, item, self._give_back) is None:
+            if self.full():
+                self.putting[task.taskid] = item
+                scheduler.wait_in_queue(task, self.putters, timeout, 'put %r' % self, self._put_timeout)
+                return
+            self.items.append(item)
+        scheduler.schedule(task, True)
+
+    def _give_back(self, scheduler, task, item):
+        """The getter killed before it got the item, keep the item at the head."""
+        if scheduler.wake_queue(self.getters, item, self._give_back) is None:
+            self.items.appendleft(item)
+
+    def _put_timeout(self, scheduler, task):
+        del self.putting[task.taskid]
+        scheduler.schedule(task)
+
+    def _get(self, scheduler, task, timeout):
+        if not self.items:
+            scheduler.wait_in_queue(task, self.getters, timeout, 'get %r' % self)
+            return
+        task.sendval = self.items.popleft()
+        putter = scheduler.wake_queue(self.putters) # a room for the first putter
+        if putter is not None:
+            self.items.append(self.putting.pop(putter.taskid))
+        scheduler.schedule(task, True)
+
+    def __repr__(self):
+        return '<Queue size %d max %s getters %d putters %d>' % (
+            len(self.items), self.maxsize, self.getters.waiting(), self.putters.waiting())
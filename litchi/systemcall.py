@@ -24,52 +24,109 @@
 from types import GeneratorType
 
 
+class TimeoutError(Exception):
+    """Throw into the task when its waiting is timeout."""
+
+
+class TaskCancelled(BaseException):
+    """Throw into the killed task, it unwinds the coroutines through their finally blocks,
+    which can still yield. Not an Exception, so `except Exception` doesn't swallow it.
+    """
+
+
+# all the SystemCall classes, the scheduler dispatch the yielded value by its exact type
+systemcall_types = set()
+
+
+class _SystemCallType(type):
+    """Register every SystemCall class into systemcall_types."""
+    def __init__(cls, name, bases, attrs):
+        super(_SystemCallType, cls).__init__(name, bases, attrs)
+        systemcall_types.add(cls)
+
+
 class SystemCall(object):
-    """A system call base interface."""
-    def handle(self):
+    """A system call base interface.
+    The scheduler call handle(scheduler, task) with the task which yielded the call.
+    """
+    __metaclass__ = _SystemCallType
+    __slots__ = ()
+    
+    def handle(self, scheduler, task):
         raise NotImplementedError('MUST be implement by the child')
     
 class Sleep(SystemCall):
-    """Sleep Call, if seconds == 0, task will add to the end of schedule queue."""
-    def __init__(self, seconds=0):
+    """Sleep Call, if seconds == 0, task will add to the end of schedule queue.
+    Sleep(0) is a shared instance, it can be yielded by any tasks.
+    """
+    __slots__ = ('seconds',)
+    
+    def __new__(cls, seconds=0):
+        if seconds <= 0 and cls is Sleep:
+            return _sleep0
+        self = SystemCall.__new__(cls)
         self.seconds = seconds
+        return self
         
-    def handle(self):
+    def handle(self, scheduler, task):
         if self.seconds <= 0:
-            self.scheduler.schedule(self.task)
+            scheduler.schedule(task)
         else:
-            self.scheduler.wait_for_sleep(self.task, self.seconds)
+            scheduler.wait_for_sleep(task, self.seconds)
+    
+_sleep0 = SystemCall.__new__(Sleep)
+_sleep0.seconds = 0
     
 class GetTaskid(SystemCall):
-    """Get the related task id"""
+    """Get the related task id, GetTaskid() is a shared instance."""
+    __slots__ = ()
     
-    def handle(self):
-        self.task.sendval = self.task.taskid
-        self.scheduler.schedule(self.task, True)
+    def __new__(cls):
+        return _gettaskid
+    
+    def handle(self, scheduler, task):
+        task.sendval = task.taskid
+        scheduler.schedule(task, True)
+        
+_gettaskid = SystemCall.__new__(GetTaskid)
         
 class NewTask(SystemCall):
-    def __init__(self, target, name=None):
+    __slots__ = ('target', 'name', 'joinable', 'priority', 'inherit_context')
+    
+    def __init__(self, target, name=None, joinable=False, priority=None, inherit_context=False):
         """target create a new task call.
         @param target: target must be a Coroutine(Generator)
+        @param joinable: keep the new task's result after exit until WaitAll/WaitAny get it.
+        @param priority: litchi.schedule.PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW, None means normal.
+        @param inherit_context: the new task starts with a copy of the caller's context, see litchi.context.
         """
         assert isinstance(target, GeneratorType), 'target must be a Coroutine(Generator)'
         self.target = target
         self.name = name
+        self.joinable = joinable
+        self.priority = priority
+        self.inherit_context = inherit_context
         
-    def handle(self):
-        taskid = self.scheduler.new(self.target, self.name)
-        self.task.sendval = taskid # return the new task id to the caller
-        self.scheduler.schedule(self.task)
+    def handle(self, scheduler, task):
+        context = None
+        if self.inherit_context and task.context is not None:
+            context = dict(task.context) # the child's changes don't leak to the parent
+        taskid = scheduler.new(self.target, self.name, self.joinable, self.priority, context)
+        task.sendval = taskid # return the new task id to the caller
+        scheduler.schedule(task)
         
 class KillTask(SystemCall):
+    """Cancel the tasks, see Scheduler.kill_tasks(), the task get the killed taskids."""
+    __slots__ = ('taskids',)
+    
     def __init__(self, taskids):
         if isinstance(taskids, int):
             taskids = [taskids]
         self.taskids = taskids
         
-    def handle(self):
-        self.task.sendval = self.scheduler.kill_tasks(self.taskids)
-        self.scheduler.schedule(self.task, True)
+    def handle(self, scheduler, task):
+        task.sendval = scheduler.kill_tasks(self.taskids)
+        scheduler.schedule(task, True)
         
 class WaitTask(SystemCall):
     """
@@ -83,48 +140,127 @@ class WaitTask(SystemCall):
   (which is where it properly belongs)
 
     """
+    __slots__ = ('wait_taskid',)
+    
     def __init__(self, wait_taskid):
         self.wait_taskid = wait_taskid
         
-    def handle(self):
-        result = self.scheduler.wait_for_exit(self.task, self.wait_taskid)
-        self.task.sendval = result
+    def handle(self, scheduler, task):
+        result = scheduler.wait_for_exit(task, self.wait_taskid)
+        task.sendval = result
         # If waiting for a non-existent task,
         # return immediately without waiting
         if not result:
-            self.scheduler.schedule(self.task)
+            scheduler.schedule(task)
+
+class WaitAll(SystemCall):
+    """Wait for all the tasks to exit, get the list of their results.
+    
+    A task's result is the last value its top coroutine yielded.
+    If some tasks exit with exception, the first one's exception will be raised.
+    Create the tasks with NewTask(target, joinable=True), or the result of task
+    which exited before WaitAll can't be got.
+    If timeout seconds passed and some tasks still running, TimeoutError will be raised.
+    """
+    __slots__ = ('taskids', 'timeout')
+    
+    def __init__(self, taskids, timeout=None):
+        self.taskids = taskids
+        self.timeout = timeout
+        
+    def handle(self, scheduler, task):
+        scheduler.join_tasks(task, self.taskids, False, self.timeout)
+        
+class WaitAny(WaitAll):
+    """Wait for any of the tasks to exit, get (taskid, result) of it,
+    or the exception the task exit with will be raised.
+    """
+    __slots__ = ()
+    
+    def handle(self, scheduler, task):
+        scheduler.join_tasks(task, self.taskids, True, self.timeout)
 
 class ReadWait(SystemCall):
-    """Waiting for file descriptor readable"""
-    def __init__(self, f):
+    """Waiting for file descriptor readable.
+    If timeout seconds passed and still not readable, TimeoutError will be thrown into the task.
+    """
+    __slots__ = ('f', 'timeout')
+    
+    def __init__(self, f, timeout=None):
         self.f = f
+        self.timeout = timeout
     
-    def handle(self):
+    def handle(self, scheduler, task):
         fd = self.f.fileno()
-        self.scheduler.wait_for_read(self.task, fd)
+        scheduler.wait_for_read(task, fd, self.timeout, self.f)
         
 class WriteWait(SystemCall):
-    """Waiting for file descriptor writable"""
-    def __init__(self, f):
+    """Waiting for file descriptor writable.
+    If timeout seconds passed and still not writable, TimeoutError will be thrown into the task.
+    """
+    __slots__ = ('f', 'timeout')
+    
+    def __init__(self, f, timeout=None):
         self.f = f
+        self.timeout = timeout
     
-    def handle(self):
+    def handle(self, scheduler, task):
         fd = self.f.fileno()
-        self.scheduler.wait_for_write(self.task, fd)
+        scheduler.wait_for_write(task, fd, self.timeout, self.f)
         
 class Wait(SystemCall):
-    """Wait for some event happened"""
-    def __init__(self, event):
+    """Wait for some event happened, get the value it fired with.
+    If timeout seconds passed and the event not fired, TimeoutError will be thrown into the task.
+    """
+    __slots__ = ('event', 'timeout')
+    
+    def __init__(self, event, timeout=None):
         self.event = event
+        self.timeout = timeout
         
-    def handle(self):
-        self.scheduler.wait_for_event(self.task, self.event)
+    def handle(self, scheduler, task):
+        scheduler.wait_for_event(task, self.event, self.timeout)
         
 class Fire(SystemCall):
-    def __init__(self, event, value=None):
+    """Fire the event with the value, wake up the first waiting task, or all of them if broadcast.
+    The task get the number of the tasks woken up.
+    """
+    __slots__ = ('event', 'value', 'broadcast')
+    
+    def __init__(self, event, value=None, broadcast=False):
         self.event = event
         self.value = value
+        self.broadcast = broadcast
+    
+    def handle(self, scheduler, task):
+        task.sendval = scheduler.fire_event(self.event, self.value, self.broadcast)
+        scheduler.schedule(task, True) # let task finish
+        
+class RunInThread(SystemCall):
+    """Run a blocking call in the scheduler's worker thread pool,
+    the task get the call's return value, or the exception raise by the call.
+    """
+    __slots__ = ('func', 'args', 'kwargs')
     
-    def handle(self):
-        self.scheduler.fire_event(self.event, self.value)
-        self.scheduler.schedule(self.task, True) # let task finish
\ No newline at end of file
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        
+    def handle(self, scheduler, task):
+        scheduler.run_in_thread(task, self.func, self.args, self.kwargs)
+        
+class RunInProcess(SystemCall):
+    """Run a CPU-bound call in the scheduler's worker process pool,
+    the task get the call's return value, or the exception raise by the call.
+    The function, arguments and return value MUST be picklable.
+    """
+    __slots__ = ('func', 'args', 'kwargs')
+    
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        
+    def handle(self, scheduler, task):
+        scheduler.run_in_process(task, self.func, self.args, self.kwargs)
\ No newline at end of file
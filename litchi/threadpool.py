@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A bounded worker thread pool, run the blocking calls out of the scheduler's thread.
+
+The worker threads put the finished jobs into a queue and write a byte to a self-pipe,
+the scheduler waits the pipe readable like any other fd, then collect the finished jobs.
+"""
+import os
+import sys
+import errno
+import fcntl
+import threading
+import Queue
+from collections import deque
+
+
+class ThreadPool(object):
+    """A bounded worker thread pool, the threads start on demand."""
+    
+    def __init__(self, size=10):
+        self.size = size
+        self.jobs = Queue.Queue()
+        self.finished = deque() # (job, result, error), deque append and popleft are thread safe
+        self.threads = []
+        self.idle = 0
+        self.pending = 0 # the jobs submitted and not collected yet
+        self._lock = threading.Lock()
+        self._reader, self._writer = os.pipe()
+        for fd in (self._reader, self._writer):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        
+    def fileno(self):
+        """The fd will be readable when some jobs finished."""
+        return self._reader
+        
+    def submit(self, job, func, args=(), kwargs={}):
+        """Run func(*args, **kwargs) in a worker thread, the job is anything to identify it."""
+        self.pending += 1
+        with self._lock: # not enough idle threads for the queued jobs, start one more
+            start = self.jobs.qsize() >= self.idle and len(self.threads) < self.size
+        if start:
+            thread = threading.Thread(target=self._work, name='litchi-worker-%d' % len(self.threads))
+            thread.daemon = True
+            self.threads.append(thread)
+            thread.start()
+        self.jobs.put((job, func, args, kwargs))
+        
+    def collect(self):
+        """Get the finished jobs, list of (job, result, error), error is sys.exc_info() or None."""
+        try:
+            while os.read(self._reader, 4096):
+                pass
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+        finished = []
+        while self.finished:
+            finished.append(self.finished.popleft())
+        self.pending -= len(finished)
+        return finished
+    
+    def _work(self):
+        while True:
+            with self._lock:
+                self.idle += 1
+            job, func, args, kwargs = self.jobs.get()
+            with self._lock:
+                self.idle -= 1
+            try:
+                self.finished.append((job, func(*args, **kwargs), None))
+            except:
+                self.finished.append((job, None, sys.exc_info()))
+            try:
+                os.write(self._writer, 'x')
+            except OSError, e:
+                if e.errno != errno.EAGAIN: # pipe full, the scheduler will be woken up anyway
+                    raise
+    
+    def __repr__(self):
+        return '<ThreadPool threads: %d, idle: %d, pending: %d, size: %d>' % \
+            (len(self.threads), self.idle, self.pending, self.size)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Watch the mainloop from a thread, see Scheduler.mainloop(watchdog=..., watchdog_thread=True).
+
+The mainloop only knows a step is too long after the step finished, if a task
+never yields again the thread is the only one can tell where it stuck.
+"""
+import sys
+import time
+import logging
+import threading
+import traceback
+
+
+class WatchdogThread(threading.Thread):
+    """Log the stack of the mainloop thread when a task step run over the threshold."""
+    
+    def __init__(self, scheduler, threshold):
+        """
+        @param threshold: seconds, check the running step every threshold / 2 seconds.
+        """
+        super(WatchdogThread, self).__init__(name='litchi-watchdog')
+        self.daemon = True
+        self.scheduler = scheduler
+        self.threshold = threshold
+        self.loop_thread = threading.current_thread().ident
+        self.stopped = threading.Event()
+        
+    def run(self):
+        reported = None # log a stuck step once
+        while not self.stopped.wait(self.threshold / 2.0):
+            running = self.scheduler.running
+            if running is None or running is reported:
+                continue
+            task, started = running
+            elapsed = time.time() - started
+            if elapsed > self.threshold:
+                reported = running
+                frame = sys._current_frames().get(self.loop_thread)
+                stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+                logging.warning('%r is still running after %.1fms, the loop thread stack:\n%s' % (
+                    task, elapsed * 1000, stack))
+                
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The scheduler on an asyncio loop, litchi tasks mixed with asyncio coroutines
+"""
+import sys
+import socket
+
+try:
+    import trollius as asyncio # the asyncio of Python 2
+    from trollius import From, Return
+except ImportError:
+    print 'asyncio hub test skipped, no trollius'
+    sys.exit(0)
+
+from litchi.schedule import Scheduler
+from litchi.systemcall import NewTask, KillTask, Sleep, ReadWait, WriteWait, WaitAll
+from litchi.systemcall import TimeoutError
+from litchi.asynciohub import AsyncioEventHub, Await
+
+
+def echo(sock):
+    while True:
+        yield ReadWait(sock)
+        data = sock.recv(100)
+        if not data:
+            break
+        yield WriteWait(sock)
+        sock.send(data)
+    sock.close()
+
+@asyncio.coroutine
+def add_later(a, b):
+    yield From(asyncio.sleep(0.01))
+    raise Return(a + b)
+
+@asyncio.coroutine
+def fail_later():
+    yield From(asyncio.sleep(0.001))
+    raise ValueError('async failed')
+
+def litchi_client(sock, results):
+    for word in ('a', 'bc', 'def'):
+        sock.send(word)
+        yield ReadWait(sock, timeout=1)
+        results.append(sock.recv(100))
+        yield Sleep(0.001)
+    sock.close()
+
+def awaiter(results):
+    results.append((yield Await(add_later(1, 2))))
+    try:
+        yield Await(fail_later())
+    except ValueError, e:
+        results.append(str(e))
+    silent, other = socket.socketpair()
+    try:
+        yield ReadWait(silent, timeout=0.01)
+    except TimeoutError:
+        results.append('timeout')
+    silent.close()
+    other.close()
+
+def hanging(cancelled):
+    future = asyncio.Future()
+    cancelled.append(future)
+    yield Await(future)
+
+def killer(cancelled):
+    task = yield NewTask(hanging(cancelled))
+    yield Sleep(0.005)
+    yield KillTask(task)
+
+def main(results, cancelled):
+    a, b = socket.socketpair()
+    tasks = [(yield NewTask(echo(a), joinable=True)),
+             (yield NewTask(litchi_client(b, results), joinable=True)),
+             (yield NewTask(awaiter(results), joinable=True)),
+             (yield NewTask(killer(cancelled), joinable=True))]
+    yield WaitAll(tasks)
+
+@asyncio.coroutine
+def asyncio_ticker(ticks):
+    for i in range(5):
+        yield From(asyncio.sleep(0.002))
+        ticks.append(i)
+
+def test_driven():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    hub = AsyncioEventHub(loop)
+    s = Scheduler(hub=hub)
+    results, cancelled, ticks = [], [], []
+    s.new(main(results, cancelled))
+    done = hub.start(s)
+    loop.run_until_complete(asyncio.wait([done, asyncio.ensure_future(asyncio_ticker(ticks), loop=loop)]))
+    assert done.result() is None
+    assert sorted(results) == sorted(['a', 'bc', 'def', 3, 'async failed', 'timeout']), results
+    assert cancelled[0].cancelled() and ticks == range(5)
+    assert not hub.fds and not s.taskmap
+
+    # the exception of a task ends the driving
+    def bad():
+        yield Sleep(0.001)
+        raise KeyError('bad')
+    s.new(bad())
+    try:
+        loop.run_until_complete(hub.start(s))
+        assert False
+    except KeyError:
+        pass
+    loop.close()
+
+def test_mainloop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    s = Scheduler(hub=AsyncioEventHub(loop))
+    results, cancelled = [], []
+    s.new(main(results, cancelled))
+    s.mainloop()
+    assert sorted(results) == sorted(['a', 'bc', 'def', 3, 'async failed', 'timeout']), results
+    assert cancelled[0].cancelled()
+    loop.close()
+
+test_driven()
+test_mainloop()
+print 'asyncio hub test ok'
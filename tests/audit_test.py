@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The scheduler audit test
+"""
+import socket
+import logging
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, KillTask, Sleep, Wait, Fire, ReadWait, WaitTask, GetTaskid
+from litchi.sync import Lock
+from litchi.audit import Auditor
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def reader(sock):
+    yield ReadWait(sock)
+
+def event_waiter():
+    yield Wait('audit event')
+
+def sleeper():
+    while True:
+        yield Sleep(0.01) # a new wait every time, never stuck
+
+def locker(lock):
+    yield lock.acquire()
+
+def joiner(taskid):
+    yield WaitTask(taskid)
+
+def test():
+    s = get_scheduler()
+    a, b = socket.socketpair()
+    lock = Lock()
+    yield lock.acquire()
+    tasks = [(yield NewTask(reader(a), 'reader')),
+             (yield NewTask(event_waiter(), 'waiter')),
+             (yield NewTask(event_waiter(), 'waiter')),
+             (yield NewTask(sleeper(), 'sleeper')),
+             (yield NewTask(locker(lock), 'locker'))]
+    tasks.append((yield NewTask(joiner(tasks[0]), 'joiner')))
+    yield Sleep(0.005)
+    auditor = Auditor(s, stuck=0.05)
+    snapshot = auditor.snapshot()
+    groups = snapshot['groups']
+    assert groups[('reader', 'read')]['count'] == 1, groups
+    assert groups[('waiter', 'event')]['count'] == 2, groups
+    assert groups[('sleeper', 'sleep')]['count'] == 1, groups
+    assert groups[('locker', 'queue')]['count'] == 1, groups
+    assert groups[('joiner', 'exit')]['count'] == 1, groups
+    assert snapshot['growth'] is None and not snapshot['stuck']
+    assert snapshot['tables']['event_slots'] >= 1 and snapshot['tables']['read'] == 1
+
+    for _ in range(3):
+        yield NewTask(sleeper(), 'more')
+    yield Sleep(0.06)
+    snapshot = auditor.snapshot()
+    assert snapshot['growth'] > 0, snapshot['growth']
+    stuck = sorted((task.name, state, key) for task, state, key, seconds in snapshot['stuck'])
+    assert stuck == [('joiner', 'exit', tasks[0]), ('locker', 'queue', lock.waiters),
+                     ('reader', 'read', a.fileno()),
+                     ('waiter', 'event', 'audit event'), ('waiter', 'event', 'audit event')], stuck
+    assert 'reader' in auditor.format(snapshot)
+
+    # woken and waiting again is a new wait
+    yield Fire('audit event')
+    yield Sleep(0)
+    yield NewTask(event_waiter(), 'waiter')
+    yield Sleep(0.01)
+    assert len([t for t in auditor.snapshot()['stuck'] if t[1] == 'event']) == 1
+
+    # the audit task logs
+    records = Records()
+    logging.root.addHandler(records)
+    logging.root.setLevel(logging.INFO)
+    yield NewTask(Auditor(s, stuck=0.01).run(0.02), 'Auditor')
+    yield Sleep(0.05)
+    logging.root.removeHandler(records)
+    assert any(m.startswith('scheduler audit') for m in records.messages)
+    assert any('waits read' in m and 'reader' in m for m in records.messages), records.messages
+    me = yield GetTaskid()
+    yield KillTask([t for t in s.taskmap if t != me])
+    a.close()
+    b.close()
+    print 'audit test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""KillTask cancellation test: TaskCancelled unwinds through the finally blocks,
+the killed task is removed from its waiting.
+"""
+import socket
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, KillTask, Sleep, Wait, Fire, ReadWait, WaitTask, \
+    WaitAll, RunInThread, TaskCancelled
+from litchi.sync import Lock, Queue
+from litchi.pool import Pool
+
+s = get_scheduler()
+
+
+def inner(log):
+    try:
+        yield Sleep(10)
+    finally:
+        log.append('inner')
+        yield Sleep(0) # can yield while unwinding
+        log.append('inner yielded')
+
+def outer(log):
+    try:
+        yield inner(log)
+    finally:
+        log.append('outer')
+
+def test_unwind():
+    log = []
+    task = yield NewTask(outer(log), joinable=True)
+    yield Sleep(0.01)
+    assert (yield KillTask(task)) == [task]
+    try:
+        yield WaitAll([task])
+        assert False
+    except TaskCancelled:
+        pass
+    assert log == ['inner', 'inner yielded', 'outer'], log
+    assert task not in s.taskmap and not s.sleep_waiting
+    assert (yield KillTask(task)) == [] # already exit
+
+def catcher(log):
+    try:
+        yield Sleep(10)
+    except Exception:
+        log.append('swallowed')
+
+def test_not_exception():
+    log = []
+    task = yield NewTask(catcher(log))
+    yield Sleep(0)
+    yield KillTask(task)
+    yield WaitTask(task)
+    assert not log
+
+def reader(sock):
+    yield ReadWait(sock, timeout=10)
+
+def test_io():
+    a, b = socket.socketpair()
+    fd = a.fileno()
+    task = yield NewTask(reader(a))
+    yield Sleep(0.01)
+    assert fd in s.read_waiting and fd in s.hub.fds
+    yield KillTask(task)
+    assert fd not in s.read_waiting and fd not in s.hub.fds
+    assert task not in s.timeout_waiting
+    yield WaitTask(task)
+    a.close()
+    b.close()
+
+def waiter(event):
+    yield Wait(event)
+
+def test_event():
+    tasks = []
+    for _ in range(3):
+        tasks.append((yield NewTask(waiter('cancel event'))))
+    yield Sleep(0)
+    yield KillTask(tasks[1])
+    assert s.event_waitting['cancel event'].waiting() == 2
+    assert (yield Fire('cancel event', broadcast=True)) == 2
+    yield WaitAll(tasks)
+
+def locker(lock, log):
+    yield lock.acquire()
+    try:
+        log.append('locked')
+        yield Sleep(10)
+    finally:
+        yield lock.release()
+
+def test_lock():
+    lock = Lock()
+    log = []
+    holder = yield NewTask(locker(lock, log))
+    blocked = yield NewTask(locker(lock, log))
+    yield Sleep(0.01)
+    assert lock.owner == holder and lock.waiters.waiting() == 1
+    yield KillTask(blocked) # stop waiting the lock
+    yield Sleep(0)
+    assert lock.waiters.waiting() == 0 and log == ['locked']
+    yield KillTask(holder) # release in the finally block
+    yield WaitAll([holder, blocked])
+    assert not lock.locked()
+
+    # the woken owner killed before it runs, the lock goes to the next
+    yield lock.acquire()
+    first = yield NewTask(locker(lock, log))
+    second = yield NewTask(locker(lock, log))
+    yield Sleep(0)
+    yield lock.release()
+    assert lock.owner == first
+    yield KillTask(first)
+    assert lock.owner == second
+    yield KillTask(second)
+    yield WaitAll([first, second])
+    assert not lock.locked()
+
+def putter(queue, item):
+    yield queue.put(item)
+
+def getter(queue, got):
+    got.append((yield queue.get()))
+
+def test_queue():
+    queue = Queue(1)
+    got = []
+    first = yield NewTask(getter(queue, got))
+    second = yield NewTask(getter(queue, got))
+    yield Sleep(0)
+    yield queue.put('item') # handed over to the first
+    yield KillTask(first) # before it runs, the item goes to the second
+    yield WaitAll([first, second])
+    assert got == ['item'] and not queue.items
+
+    yield queue.put(1)
+    task = yield NewTask(putter(queue, 2))
+    yield Sleep(0)
+    yield KillTask(task)
+    yield WaitTask(task)
+    assert not queue.putting and not queue.putters.waiting() and list(queue.items) == [1]
+
+def connect():
+    yield Sleep(0.001)
+    yield object()
+
+def user(pool):
+    conn = yield pool.get()
+    try:
+        yield Sleep(10)
+    finally:
+        yield pool.put(conn)
+
+def test_pool():
+    pool = Pool(connect, 0, 1)
+    task = yield NewTask(user(pool))
+    yield Sleep(0.01)
+    yield KillTask(task)
+    yield WaitTask(task)
+    assert pool.connected_count == 1 and len(pool.free_items) == 1, pool
+
+    # killed while connecting
+    pool = Pool(connect, 0, 1)
+    task = yield NewTask(user(pool))
+    yield Sleep(0)
+    yield KillTask(task)
+    yield WaitTask(task)
+    assert pool.connected_count == 0, pool
+
+def sleeper():
+    yield Sleep(10)
+
+def joiner(taskid):
+    yield WaitTask(taskid)
+
+def test_join_and_thread():
+    sleeping = yield NewTask(sleeper())
+    task = yield NewTask(joiner(sleeping))
+    yield Sleep(0)
+    yield KillTask(task)
+    yield WaitTask(task)
+    assert sleeping not in s.exit_waiting
+
+    def blocking():
+        yield RunInThread(socket.gethostbyname, 'localhost')
+        assert False
+    task = yield NewTask(blocking())
+    yield Sleep(0)
+    yield KillTask(task)
+    yield WaitTask(task)
+    yield KillTask(sleeping)
+    yield Sleep(0.05) # the thread result is dropped
+
+def test():
+    yield test_unwind()
+    yield test_not_exception()
+    yield test_io()
+    yield test_event()
+    yield test_lock()
+    yield test_queue()
+    yield test_pool()
+    yield test_join_and_thread()
+    print 'cancel test ok'
+
+s.new(test())
+s.mainloop()
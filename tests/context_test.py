@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Task-local context test
+"""
+from litchi import schedule
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, WaitAll, Sleep, RunInThread
+from litchi import context
+
+
+def deep(key):
+    yield Sleep(0.001) # other tasks run between
+    yield context.get(key)
+
+def handler(request_id, seen):
+    context.set('request_id', request_id)
+    seen.append((request_id, (yield deep('request_id'))))
+
+def child(seen):
+    seen.append(('child', context.get('request_id'), context.get('span')))
+    context.set('request_id', 'changed by child')
+    yield
+
+def parent(seen):
+    context.set('request_id', 'parent')
+    context.set('span', 1)
+    tasks = [(yield NewTask(child(seen), inherit_context=True, joinable=True)),
+             (yield NewTask(child(seen), joinable=True))]
+    yield WaitAll(tasks)
+    assert context.get('request_id') == 'parent' # a copy inherited
+
+def test():
+    assert context.get('request_id', 'none') == 'none'
+    seen = []
+    tasks = []
+    for i in range(10):
+        tasks.append((yield NewTask(handler(i, seen), joinable=True)))
+    yield WaitAll(tasks)
+    assert sorted(seen) == [(i, i) for i in range(10)], seen
+    assert context.get('request_id') is None
+
+    seen = []
+    yield WaitAll([(yield NewTask(parent(seen), joinable=True))])
+    assert seen == [('child', 'parent', 1), ('child', None, None)], seen
+    assert context.current_task() is s.current
+
+    # a worker thread has no task, and no scheduler is created for it
+    def in_thread():
+        return context.get('request_id', 'none'), getattr(schedule._current, 'scheduler', None)
+    assert (yield RunInThread(in_thread)) == ('none', None)
+    print 'context test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
+assert context.current_task() is None
+try:
+    context.set('out', 1)
+    assert False
+except RuntimeError:
+    pass
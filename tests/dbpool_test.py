@@ -5,7 +5,7 @@
 
 from litchi.pool import Pool
 from litchi.db.mysql import connect
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.systemcall import WaitTask, NewTask, Sleep
 
 
@@ -13,7 +13,7 @@ def free_conn(pool, conn):
     yield Sleep(1)
     assert pool.waittings
     assert pool.connected_count == pool.maxsize
-    assert pool.wait_event in schedule.event_waitting
+    assert pool.free_items.getters.waiting() == pool.waittings
     yield pool.put(conn)
 
 def pool_test(minsize, maxsize):
@@ -50,6 +50,6 @@ def pool_test(minsize, maxsize):
     
     exit()
 
-schedule = Scheduler.instance()
+schedule = get_scheduler()
 schedule.new(pool_test(5, 10))
 schedule.mainloop()
\ No newline at end of file
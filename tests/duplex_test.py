@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""one reader and one writer task on the same fd
+"""
+import socket
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import ReadWait, WriteWait, NewTask, WaitTask
+
+SIZE = 1024 * 1024
+done = []
+
+
+def reader(sock, expect):
+    data = ''
+    while len(data) < expect:
+        yield ReadWait(sock)
+        data += sock.recv(65536)
+    assert data == 'x' * expect
+    done.append('reader')
+
+def writer(sock, size):
+    buf = 'y' * size
+    while buf:
+        yield WriteWait(sock)
+        buf = buf[sock.send(buf):]
+    done.append('writer')
+
+def peer(sock, size, reply):
+    # read all the writer's data before reply, so the reader waits the whole time
+    received = 0
+    while received < size:
+        yield ReadWait(sock)
+        received += len(sock.recv(65536))
+    buf = 'x' * reply
+    while buf:
+        yield WriteWait(sock)
+        buf = buf[sock.send(buf):]
+    done.append('peer')
+
+def test():
+    a, b = socket.socketpair()
+    a.setblocking(0)
+    b.setblocking(0)
+    # reader and writer share the fd of a
+    r = yield NewTask(reader(a, 1000))
+    w = yield NewTask(writer(a, SIZE))
+    p = yield NewTask(peer(b, SIZE, 1000))
+    for taskid in (r, w, p):
+        yield WaitTask(taskid)
+    assert sorted(done) == ['peer', 'reader', 'writer'], done
+    print 'duplex test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
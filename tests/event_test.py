@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""broadcast Fire, Wait with timeout and the event slots cleanup test
+"""
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, Wait, Fire, Sleep, TimeoutError
+
+
+def waiter(event, got, timeout=None):
+    try:
+        value = yield Wait(event, timeout)
+        got.append(value)
+    except TimeoutError:
+        got.append('timeout')
+
+def test():
+    s = get_scheduler()
+    # broadcast wakes all the waiters in their waiting order
+    got = []
+    for i in range(5):
+        yield NewTask(waiter('news', got))
+    yield Sleep(0)
+    woken = yield Fire('news', 'hello', broadcast=True)
+    assert woken == 5, woken
+    yield Sleep(0)
+    assert got == ['hello'] * 5, got
+    
+    # without broadcast only the first one
+    got = []
+    for i in range(2):
+        yield NewTask(waiter('one', got))
+    yield Sleep(0)
+    assert (yield Fire('one', 1)) == 1
+    yield Sleep(0)
+    assert got == [1], got
+    assert (yield Fire('one', 2)) == 1
+    assert (yield Fire('one', 3)) == 0
+    yield Sleep(0)
+    assert got == [1, 2], got
+    
+    # timeout
+    got = []
+    start = time.time()
+    yield NewTask(waiter('late', got, 0.05))
+    yield NewTask(waiter('late', got))
+    yield Sleep(0.1)
+    assert got == ['timeout'], got
+    assert (yield Fire('late', 'value')) == 1 # the timed out one is skipped
+    yield Sleep(0)
+    assert got == ['timeout', 'value'], got
+    
+    # the fired waiter's timeout is cancelled
+    got = []
+    yield NewTask(waiter('early', got, 0.05))
+    yield Sleep(0)
+    yield Fire('early', 'in time')
+    yield Sleep(0.1)
+    assert got == ['in time'], got
+    assert not s.timeout_waiting, s.timeout_waiting
+    
+    # unique event keys don't grow the slots
+    for n in range(5):
+        got = []
+        for i in range(1000):
+            yield NewTask(waiter(('request', n, i), got, 0.01 if i % 2 else None))
+        yield Sleep(0)
+        for i in range(0, 1000, 2):
+            yield Fire(('request', n, i), i)
+        yield Sleep(0.05)
+        assert len(got) == 1000, len(got)
+    assert len(s.event_waitting) <= 2 * s.EVENT_SLOTS_SWEEP, len(s.event_waitting)
+    s._sweep_events()
+    assert not s.event_waitting, s.event_waitting
+    print 'event test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
@@ -3,7 +3,7 @@
 """memcache test
 """
 
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.memcached import AsyncClient
 
 
@@ -18,6 +18,6 @@ def test():
     
     exit()
 
-s = Scheduler.instance()
+s = get_scheduler()
 s.new(test())
 s.mainloop()
\ No newline at end of file
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Independent schedulers, one per thread
+"""
+import threading
+
+from litchi.schedule import Scheduler, get_scheduler, set_scheduler
+from litchi.systemcall import NewTask, Sleep, Wait, Fire, WaitAll
+from litchi.pool import Pool
+from litchi.io import SelectEventHub, forget
+
+
+def connect():
+    yield Sleep(0.001)
+    yield object()
+
+def waiter(got):
+    got.append((yield Wait('shared name')))
+
+def worker(name, results):
+    pool = Pool(connect, 1, 2) # in the running scheduler of the thread
+    got = []
+    tasks = [(yield NewTask(waiter(got), joinable=True)) for _ in range(3)]
+    yield Sleep(0.01)
+    # the same event name in the other loop doesn't wake these
+    assert (yield Fire('shared name', name, broadcast=True)) == 3
+    yield WaitAll(tasks)
+    conn = yield pool.get()
+    yield pool.put(conn)
+    results[name] = (got, get_scheduler(), pool.connected_count)
+
+def run(name, results):
+    s = get_scheduler()
+    assert s is get_scheduler() # per thread
+    s.new(worker(name, results))
+    s.mainloop()
+
+def spawn_many(n, results):
+    s = Scheduler()
+    for _ in xrange(n):
+        s.new(waiter([]))
+    results.append((s, len(s.taskmap)))
+
+def test_unique_ids():
+    # the schedulers create the tasks in parallel, every taskid is unique
+    results = []
+    threads = [threading.Thread(target=spawn_many, args=(50000, results)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [count for s, count in results] == [50000] * 4, [count for s, count in results]
+    ids = set()
+    for s, count in results:
+        ids.update(s.taskmap)
+    assert len(ids) == 200000, len(ids)
+
+def create_hubs(n, hubs):
+    for _ in xrange(n):
+        hubs.append(SelectEventHub())
+
+def test_forget():
+    # a thread creates the hubs while another closes the fds
+    hubs = []
+    thread = threading.Thread(target=create_hubs, args=(20000, hubs))
+    thread.start()
+    while thread.is_alive():
+        forget(1000)
+    thread.join()
+
+def test():
+    main = get_scheduler()
+    results = {}
+    threads = [threading.Thread(target=run, args=(name, results)) for name in ('admin', 'traffic')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results['admin'][0] == ['admin'] * 3 and results['traffic'][0] == ['traffic'] * 3, results
+    schedulers = set([results['admin'][1], results['traffic'][1], main])
+    assert len(schedulers) == 3
+    assert results['admin'][2] == results['traffic'][2] == 1
+
+    # a scheduler is current while its mainloop running, then the previous one again
+    other = Scheduler()
+    seen = []
+    def task():
+        seen.append(get_scheduler())
+        yield
+    other.new(task())
+    other.mainloop()
+    assert seen == [other] and get_scheduler() is main
+    set_scheduler(other)
+    assert get_scheduler() is other and Scheduler.instance() is other
+    set_scheduler(main)
+
+    # the deprecated instance() creates the current scheduler with the arguments
+    def thread_instance():
+        results['instance'] = Scheduler.instance(debug=False, batch_size=8)
+    thread = threading.Thread(target=thread_instance)
+    thread.start()
+    thread.join()
+    assert results['instance'].batch_size == 8 and results['instance'] not in schedulers
+    print 'multi scheduler test ok'
+
+test_unique_ids()
+test_forget()
+test()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Persistent epoll registrations, an fd closed without forget() and reused
+"""
+import socket
+
+from litchi.schedule import Scheduler
+from litchi.systemcall import ReadWait
+
+
+def read(sock):
+    yield ReadWait(sock, timeout=1)
+    yield sock.recv(100)
+
+def test():
+    a, b = socket.socketpair()
+    b.send('first')
+    assert (yield read(a)) == 'first'
+    fd = a.fileno()
+    assert s.hub.fds[fd] == s.hub.READ # the interest stays
+    a.close() # no forget(), epoll drops the fd behind the hub
+    b.close()
+    c, d = socket.socketpair()
+    assert fd in (c.fileno(), d.fileno()), (fd, c.fileno(), d.fileno())
+    if d.fileno() == fd:
+        c, d = d, c
+    d.send('second') # the same fd, the same READ interest
+    assert (yield read(c)) == 'second'
+    c.close()
+    d.close()
+    print 'persistent io test ok'
+
+s = Scheduler(persistent_io=True)
+s.new(test())
+s.mainloop()
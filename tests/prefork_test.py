@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""HTTPServer.serve() pre-fork test
+"""
+import os
+import time
+import signal
+import socket
+
+from litchi.http import HTTPServer
+
+
+
+def handler(request):
+    yield str(os.getpid())
+
+def get_pid(port):
+    for _ in range(100):
+        try:
+            sock = socket.create_connection(('127.0.0.1', port))
+            break
+        except socket.error:
+            time.sleep(0.05)
+    sock.sendall('GET / HTTP/1.0\r\n\r\n')
+    data = ''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    return int(data.split('\r\n\r\n', 1)[1])
+
+def test(port, reuse_port):
+    supervisor = os.fork()
+    if supervisor == 0:
+        try:
+            HTTPServer(handler).serve(port, num_processes=2, reuse_port=reuse_port)
+        finally:
+            os._exit(1)
+    try:
+        pids = set(get_pid(port) for _ in range(50))
+        if reuse_port: # the kernel balances the connections
+            assert len(pids) == 2, pids
+        # the crashed workers will be restarted
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+        time.sleep(0.3)
+        pid = get_pid(port)
+        assert pid not in pids, (pid, pids)
+    finally:
+        os.kill(supervisor, signal.SIGTERM)
+        os.waitpid(supervisor, 0)
+    print 'prefork test ok, reuse_port=%s' % reuse_port
+
+def wait_exit(pid, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_stop_restarting(port):
+    supervisor = os.fork()
+    if supervisor == 0:
+        try:
+            HTTPServer(handler).serve(port, num_processes=1)
+        finally:
+            os._exit(1)
+    try:
+        os.kill(get_pid(port), signal.SIGKILL)
+        time.sleep(0.05) # the supervisor sleeps before the restart
+        os.kill(supervisor, signal.SIGTERM)
+        assert wait_exit(supervisor, 2), 'the supervisor restarted a worker while stopping'
+    finally:
+        try:
+            os.kill(supervisor, signal.SIGKILL)
+            os.waitpid(supervisor, 0)
+        except OSError:
+            pass
+    print 'prefork test ok, stopped while restarting'
+
+test(8093, False)
+test(8094, True)
+test_stop_restarting(8095)
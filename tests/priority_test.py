@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""task priority test, the high tasks keep their latency in a saturated loop
+"""
+import time
+
+from litchi.schedule import Scheduler, PRIORITY_HIGH, PRIORITY_LOW
+from litchi.systemcall import NewTask, Sleep
+
+
+def busy(flag, progress):
+    while flag:
+        start = time.time()
+        while time.time() - start < 0.0002: # some work every step
+            pass
+        progress.append(1)
+        yield Sleep(0)
+
+def probe(latencies):
+    for _ in range(20):
+        start = time.time()
+        yield Sleep(0.005)
+        latencies.append(time.time() - start - 0.005)
+
+def test():
+    flag = [True]
+    normal, low = [], []
+    for _ in range(200):
+        yield NewTask(busy(flag, normal))
+    yield NewTask(busy(flag, low), priority=PRIORITY_LOW)
+    high_latencies, normal_latencies = [], []
+    yield NewTask(probe(high_latencies), priority=PRIORITY_HIGH)
+    yield NewTask(probe(normal_latencies))
+    while len(high_latencies) < 20 or len(normal_latencies) < 20:
+        yield Sleep(0.01)
+    flag.pop()
+    high, normal_max = max(high_latencies), max(normal_latencies)
+    # a pass of the 200 busy tasks is 40ms, the high task waits at most a round
+    assert high < 0.02, high_latencies
+    assert high * 2 < normal_max, (high, normal_max)
+    # the low task still get turns
+    assert low, 'low priority task starved'
+    print 'priority test ok, max wakeup latency high %.1fms normal %.1fms, low ran %d steps' % (
+        high * 1000, normal_max * 1000, len(low))
+
+s = Scheduler(batch_size=16)
+s.new(test())
+s.mainloop()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""RunInProcess test
+"""
+import os
+import errno
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import RunInProcess, NewTask, WaitTask
+from litchi.processpool import _Worker
+
+
+def burn(n):
+    total = 0
+    for i in xrange(n):
+        total += i
+    return os.getpid(), total
+
+def echo(data):
+    return data
+
+def fail():
+    raise ValueError('fail in process')
+
+def crash():
+    os._exit(1)
+
+def caller(n, results):
+    results.append((yield RunInProcess(burn, n)))
+
+def test():
+    results = []
+    callers = []
+    for _ in range(4):
+        callers.append((yield NewTask(caller(10 ** 5, results))))
+    for taskid in callers:
+        yield WaitTask(taskid)
+    assert [total for pid, total in results] == [sum(xrange(10 ** 5))] * 4, results
+    assert os.getpid() not in [pid for pid, total in results]
+    
+    # a big payload goes in chunks
+    data = 'x' * (5 * 1024 * 1024)
+    assert (yield RunInProcess(echo, data)) == data
+    
+    try:
+        yield RunInProcess(fail)
+    except ValueError, e:
+        assert str(e) == 'fail in process'
+    else:
+        assert False, 'ValueError not raise'
+    try:
+        yield RunInProcess(crash)
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'RuntimeError not raise'
+    # still work after a worker crashed
+    assert (yield RunInProcess(echo, 1)) == 1
+    
+    stats = s.process_pool.stats()
+    assert stats['calls'] == 8, stats
+    assert stats['errors'] == 2, stats
+    assert stats['queued'] == 0 and stats['busy'] == 0, stats
+    s.process_pool.close()
+    # the closed and the crashed workers are reaped, no zombie left
+    worker = _Worker() # still starting, it exits later than the close
+    worker.close()
+    try:
+        os.waitpid(-1, os.WNOHANG)
+        assert False, 'a worker not reaped'
+    except OSError, e:
+        assert e.errno == errno.ECHILD, e
+    print 'processpool test ok', stats
+
+s = get_scheduler()
+s.PROCESS_POOL_SIZE = 2
+s.new(test())
+s.mainloop()
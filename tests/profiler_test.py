@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""sampling profiler test
+"""
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import Sleep
+from litchi.profiler import Profiler
+
+
+def spin(seconds):
+    start = time.time()
+    while time.time() - start < seconds:
+        pass
+
+def inner():
+    for _ in range(20):
+        spin(0.01)
+        yield Sleep(0)
+    yield 'done'
+
+def outer():
+    result = yield inner()
+    assert result == 'done'
+
+def idle():
+    yield Sleep(0.1)
+
+def test():
+    s = get_scheduler()
+    s.new(outer(), 'worker')
+    s.new(idle(), 'idler')
+    profiler = Profiler(interval=0.001)
+    profiler.start()
+    s.mainloop()
+    profiler.stop()
+    
+    lines = profiler.collapsed()
+    assert lines, lines
+    counts = dict(line.rsplit(' ', 1) for line in lines)
+    total = sum(int(count) for count in counts.itervalues())
+    # the logical stack has the caller coroutine, not Task.run
+    hot = [stack for stack in counts if stack.startswith('worker;outer (') and ';inner (' in stack
+           and stack.split(';')[-1].startswith('spin (')]
+    assert hot, lines
+    assert sum(int(counts[stack]) for stack in hot) > total * 0.5, lines
+    assert not [stack for stack in counts if 'run (schedule.py' in stack], lines
+    print '\n'.join(lines[:5])
+    print 'profiler test ok, %d samples' % total
+    
+test()
@@ -4,7 +4,7 @@
 """
 import time
 
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.systemcall import GetTaskid, NewTask, KillTask, WaitTask, Sleep
 
 
@@ -76,7 +76,7 @@ def sleeps(scheduler):
 
 import logging
 logging.root.setLevel(logging.DEBUG)
-s = Scheduler.instance()
+s = get_scheduler()
 s.new(foo())
 s.new(bar())
 s.new(create_task())
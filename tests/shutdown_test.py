@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Graceful shutdown on a signal and the listening socket inherited by the reloaded process
+"""
+import os
+import sys
+import fcntl
+import socket
+import signal
+import threading
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import Sleep
+from litchi.http import HTTPServer
+from litchi.pool import Pool
+from litchi import process
+
+
+class Connection(object):
+    closed = 0
+
+    def close(self):
+        Connection.closed += 1
+        yield Sleep(0)
+
+def connect():
+    yield Sleep(0.001)
+    yield Connection()
+
+pool = Pool(connect, 1, 2)
+
+def handler(request):
+    conn = yield pool.get()
+    try:
+        yield Sleep(float(request.arguments.get('sleep', ['0'])[0]))
+    finally:
+        yield pool.put(conn)
+    yield 'done %s' % request.path
+
+def request(port, path, results):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall('GET %s HTTP/1.1\r\nHost: test\r\n\r\n' % path)
+    data = ''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    results.append((path, data))
+
+def signaller(port, results, clients):
+    idle = socket.create_connection(('127.0.0.1', port)) # keep-alive, no request
+    for path in ('/slow?sleep=0.2', '/stuck?sleep=10'):
+        client = threading.Thread(target=request, args=(port, path, results))
+        client.start()
+        clients.append(client)
+    yield Sleep(0.1)
+    os.kill(os.getpid(), signal.SIGTERM)
+    yield Sleep(0.05)
+    try:
+        socket.create_connection(('127.0.0.1', port))
+        assert False, 'still accepting'
+    except socket.error:
+        pass
+    results.append(('idle', idle.recv(10)))
+
+def test_shutdown():
+    server = HTTPServer(handler)
+    server.listen(0)
+    port = server._socket.getsockname()[1]
+    results, clients = [], []
+    s = get_scheduler()
+    s.new(server.start())
+    s.new(server.stop_on_signals(0.5, [pool], reload=False))
+    s.new(signaller(port, results, clients))
+    s.mainloop() # until stopped
+    for client in clients:
+        client.join()
+    results = dict(results)
+    assert results['idle'] == '', results # closed at once
+    assert 'done /slow' in results['/slow?sleep=0.2'], results # drained
+    assert results['/stuck?sleep=10'] == '', results # killed after the timeout
+    assert not server.handlers and server._socket is None
+    assert pool.closed and pool.connected_count == 0 and Connection.closed == 2, (pool, Connection.closed)
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+def test_inherit():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(5)
+    port = sock.getsockname()[1]
+    fd = os.dup(sock.fileno()) # as if inherited over exec
+    sock.close()
+    os.environ[process.INHERIT_FDS_ENV] = str(fd)
+    process._inherited = None
+    assert process.inherited_socket(port + 1) is None
+    server = HTTPServer(handler)
+    server.listen(port) # takes the inherited socket, no bind
+    assert server._socket.getsockname()[1] == port
+    assert process.INHERIT_FDS_ENV not in os.environ and not process._inherited
+    client = socket.create_connection(('127.0.0.1', port))
+    client.close()
+    server._socket.close()
+
+    # spawn_reload runs the same command line, the fds are open over exec
+    r, w = os.pipe()
+    fcntl.fcntl(w, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+    argv = sys.argv
+    sys.argv = ['-c', 'import os; fd = int(os.environ["%s"]); os.write(fd, "reloaded")' % process.INHERIT_FDS_ENV]
+    try:
+        pid = process.spawn_reload([w])
+    finally:
+        sys.argv = argv
+    os.close(w)
+    assert os.read(r, 100) == 'reloaded'
+    os.close(r)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+test_shutdown()
+test_inherit()
+print 'shutdown test ok'
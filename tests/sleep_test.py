@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""sleep accuracy and idle cpu usage test
+"""
+import os
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import Sleep, NewTask
+
+
+def sleeper(seconds, errors):
+    start = time.time()
+    yield Sleep(seconds)
+    errors.append(time.time() - start - seconds)
+
+def test():
+    errors = []
+    for i in range(10):
+        yield NewTask(sleeper(0.05 * (i + 1), errors))
+    cpu_start = sum(os.times()[:2])
+    wall_start = time.time()
+    yield Sleep(0.6)
+    cpu = sum(os.times()[:2]) - cpu_start
+    wall = time.time() - wall_start
+    assert len(errors) == 10, errors
+    errors.sort()
+    assert errors[0] >= 0, errors # never wake up early
+    # the scheduling noise of a busy machine makes some late, judge the median
+    assert errors[len(errors) // 2] < 0.005, errors
+    assert errors[-1] < 0.1, errors
+    # the loop must block in poll, not spin
+    assert cpu < wall * 0.1, (cpu, wall)
+    print 'sleep test ok, max wakeup error %.2fms, cpu %.3fs in %.3fs' % (max(errors) * 1000, cpu, wall)
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
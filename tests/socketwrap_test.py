@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Socket read buffer test, the reads across the received chunks and the multi-MB reads
+"""
+import socket
+
+from litchi.schedule import get_scheduler
+from litchi.socketwrap import Socket
+from litchi.systemcall import NewTask, Sleep
+
+
+def sender(sock, chunks):
+    for chunk in chunks:
+        yield sock.send(chunk)
+        yield Sleep(0.001) # every chunk received alone
+
+def test_split():
+    a, b = socket.socketpair()
+    a, b = Socket(_sock=a), Socket(_sock=b)
+    # the delimiter split across the chunks
+    yield NewTask(sender(b, ['GET / HTTP/1.1\r', '\nHost: x\r\n\r', '\n0123456789', 'abc\r\n']))
+    assert (yield a.read_until('\r\n')) == 'GET / HTTP/1.1\r\n'
+    assert (yield a.read_until('\r\n\r\n')) == 'Host: x\r\n\r\n'
+    assert (yield a.read_bytes(4)) == '0123'
+    assert (yield a.read_bytes(6)) == '456789'
+    assert (yield a.read_until('\r\n')) == 'abc\r\n'
+    assert a.buffered() == 0 and a._read_start == a._read_end == 0
+
+    # recv returns all the buffered data and doesn't consume it
+    yield b.send('xy')
+    assert (yield a.recv()) == 'xy'
+    yield b.send('z')
+    assert (yield a.recv()) == 'xyz'
+    assert (yield a.read_bytes(3)) == 'xyz'
+    a.close()
+    b.close()
+
+def test_large():
+    a, b = socket.socketpair()
+    a, b = Socket(_sock=a), Socket(_sock=b)
+    body = ''.join(chr(i % 251) for i in range(256)) * (4 * 4096) # 4MB
+    lines = ''.join('line %d\r\n' % i for i in range(20000))
+    yield NewTask(sender(b, ['%d\r\n' % len(body), body + lines]))
+    size = int((yield a.read_until('\r\n'))[:-2])
+    assert (yield a.read_bytes(size)) == body
+    for i in range(20000):
+        assert (yield a.read_until('\r\n')) == 'line %d\r\n' % i
+    assert a.buffered() == 0
+    assert len(a._read_buffer) <= Socket.READ_BUFFER_KEEP # the large buffer dropped
+    a.close()
+    b.close()
+
+def test():
+    yield test_split()
+    yield test_large()
+    print 'socketwrap test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""scheduler statistics test
+"""
+import time
+import socket
+
+from litchi.schedule import Scheduler
+from litchi.systemcall import NewTask, Sleep, ReadWait, WaitAll
+from litchi.sync import Lock
+
+
+def hog():
+    for _ in range(3):
+        start = time.time()
+        while time.time() - start < 0.02: # block the loop
+            pass
+        yield Sleep(0)
+
+def sleeper():
+    yield Sleep(0.05)
+
+def reader(sock):
+    yield ReadWait(sock)
+    sock.recv(1)
+    
+def writer(sock):
+    yield Sleep(0.03)
+    sock.send('x')
+
+def holder(lock):
+    yield lock.acquire()
+    yield Sleep(0.03)
+    yield lock.release()
+
+def locker(lock):
+    yield Sleep(0)
+    yield lock.acquire()
+    yield lock.release()
+
+def test():
+    a, b = socket.socketpair()
+    lock = Lock()
+    tasks = []
+    tasks.append((yield NewTask(holder(lock), 'holder', joinable=True)))
+    tasks.append((yield NewTask(locker(lock), 'locker', joinable=True)))
+    tasks.append((yield NewTask(hog(), 'hog', joinable=True)))
+    tasks.append((yield NewTask(sleeper(), 'sleeper', joinable=True)))
+    tasks.append((yield NewTask(reader(a), 'reader', joinable=True)))
+    tasks.append((yield NewTask(writer(b), 'writer', joinable=True)))
+    yield WaitAll(tasks)
+    a.close()
+    b.close()
+    
+    snapshot = s.stats.snapshot()
+    hog_stats = snapshot['tasks']['hog']
+    assert hog_stats['tasks'] == 1 and hog_stats['runs'] == 4, hog_stats
+    assert hog_stats['run_time'] >= 0.06 and hog_stats['run_max'] >= 0.02, hog_stats
+    # the other tasks wait for the hog in the ready queue
+    assert snapshot['tasks']['sleeper']['waits']['ready'] >= 0.02, snapshot['tasks']['sleeper']
+    assert snapshot['tasks']['sleeper']['waits']['sleep'] >= 0.04, snapshot['tasks']['sleeper']
+    assert snapshot['tasks']['reader']['waits']['read'] >= 0.02, snapshot['tasks']['reader']
+    assert snapshot['tasks']['locker']['waits']['queue'] >= 0.02, snapshot['tasks']['locker']
+    assert 'other' not in snapshot['tasks']['locker']['waits'], snapshot['tasks']['locker']
+    waits = snapshot['tasks']['test']['waits']
+    assert waits['join'] > 0 and waits['ready'] + waits['join'] >= 0.05, waits
+    loop = snapshot['loop']
+    assert loop['iterations'] > 0 and loop['polls'] > 0 and loop['events'] >= 1, loop
+    assert loop['max_ready'] >= 3, loop
+    print s.stats.format()
+    
+    s.enable_stats(False)
+    yield Sleep(0)
+    assert s.stats is None
+    print 'stats test ok'
+
+s = Scheduler(stats=True)
+s.new(test(), 'test')
+s.mainloop()
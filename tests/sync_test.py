@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Lock, Semaphore, Condition, Queue and Pool test
+"""
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, Sleep, WaitAll, GetTaskid, TimeoutError
+from litchi.sync import Lock, Semaphore, Condition, Queue
+from litchi.pool import Pool
+
+
+def locker(lock, name, order, hold):
+    yield lock.acquire()
+    order.append(name)
+    yield Sleep(hold)
+    yield lock.release()
+
+def test_lock():
+    lock = Lock()
+    order = []
+    tasks = []
+    for name in 'abcd':
+        tasks.append((yield NewTask(locker(lock, name, order, 0.01), joinable=True)))
+    yield WaitAll(tasks)
+    assert order == list('abcd'), order # FIFO
+    assert not lock.locked()
+    
+    # timeout
+    yield lock.acquire()
+    tasks = [(yield NewTask(locker(lock, 'late', order, 0), joinable=True))]
+    try:
+        yield lock.acquire(0.01) # already holds
+        assert False
+    except RuntimeError:
+        pass
+    try:
+        yield WaitAll(tasks, timeout=0.02)
+        assert False
+    except TimeoutError:
+        pass
+    yield lock.release()
+    yield WaitAll(tasks)
+    assert order[-1] == 'late'
+    
+    def waiter():
+        yield lock.acquire(0.01)
+    yield lock.acquire()
+    task = yield NewTask(waiter(), joinable=True)
+    try:
+        yield WaitAll([task])
+        assert False
+    except TimeoutError:
+        pass
+    yield lock.release()
+    assert not lock.locked() and not lock.waiters.waiting()
+    
+    # not the owner
+    try:
+        yield lock.release()
+        assert False
+    except RuntimeError:
+        pass
+
+def worker(semaphore, running, peak):
+    yield semaphore.acquire()
+    running[0] += 1
+    peak[0] = max(peak[0], running[0])
+    yield Sleep(0.01)
+    running[0] -= 1
+    yield semaphore.release()
+
+def test_semaphore():
+    semaphore = Semaphore(3)
+    running, peak = [0], [0]
+    tasks = []
+    for _ in range(10):
+        tasks.append((yield NewTask(worker(semaphore, running, peak), joinable=True)))
+    yield WaitAll(tasks)
+    assert peak[0] == 3, peak
+    assert semaphore.value == 3
+
+def consumer(condition, items, got):
+    yield condition.acquire()
+    while not items:
+        yield condition.wait()
+    got.append(items.pop(0))
+    yield condition.release()
+
+def test_condition():
+    condition = Condition()
+    items, got = [], []
+    tasks = []
+    for _ in range(3):
+        tasks.append((yield NewTask(consumer(condition, items, got), joinable=True)))
+    yield Sleep(0)
+    yield condition.acquire()
+    items.extend([1, 2, 3])
+    woken = yield condition.notify_all()
+    assert woken == 3, woken
+    yield condition.release()
+    yield WaitAll(tasks)
+    assert sorted(got) == [1, 2, 3], got
+    
+    # timeout raise with the lock held again
+    yield condition.acquire()
+    start = time.time()
+    try:
+        yield condition.wait(0.02)
+        assert False
+    except TimeoutError:
+        pass
+    assert time.time() - start >= 0.02
+    assert condition.lock.owner == (yield GetTaskid())
+    yield condition.release()
+
+def producer(queue, count):
+    for i in range(count):
+        yield queue.put(i)
+    yield queue.put(None)
+
+def drain(queue, got, slow=0):
+    while True:
+        item = yield queue.get()
+        if item is None:
+            break
+        got.append(item)
+        if slow:
+            yield Sleep(slow)
+
+def test_queue():
+    # bounded, the producer waits for the consumer
+    queue = Queue(2)
+    got = []
+    tasks = [(yield NewTask(producer(queue, 10), joinable=True)),
+             (yield NewTask(drain(queue, got, 0.001), joinable=True))]
+    yield Sleep(0)
+    assert queue.full() and queue.putters.waiting() == 1, queue
+    yield WaitAll(tasks)
+    assert got == range(10), got
+    assert queue.empty() and not queue.putting
+    
+    # timeouts
+    try:
+        yield queue.get(0.01)
+        assert False
+    except TimeoutError:
+        pass
+    yield queue.put(1)
+    yield queue.put(2)
+    try:
+        yield queue.put(3, 0.01)
+        assert False
+    except TimeoutError:
+        pass
+    assert not queue.putting and len(queue) == 2
+    assert (yield queue.get()) == 1
+    assert (yield queue.get()) == 2
+
+def connect():
+    yield Sleep(0.001)
+    yield object()
+
+def user(pool, hold):
+    conn = yield pool.get()
+    yield Sleep(hold)
+    yield pool.put(conn)
+
+def test_pool():
+    pool = Pool(connect, 1, 3)
+    tasks = []
+    for _ in range(10):
+        tasks.append((yield NewTask(user(pool, 0.01), joinable=True)))
+    yield Sleep(0.005)
+    assert pool.waittings == 7, pool
+    yield WaitAll(tasks)
+    assert pool.connected_count == 3 and len(pool.free_items) == 3 and not pool.waittings, pool
+
+def test():
+    yield test_lock()
+    yield test_semaphore()
+    yield test_condition()
+    yield test_queue()
+    yield test_pool()
+    print 'sync test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
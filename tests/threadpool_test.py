@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""RunInThread test
+"""
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import RunInThread, NewTask, WaitTask, Sleep
+
+ticks = []
+
+
+def blocking(seconds, value):
+    time.sleep(seconds)
+    return value
+
+def fail():
+    raise ValueError('fail in thread')
+
+def ticker():
+    # the loop keeps running while the threads block
+    for _ in range(5):
+        ticks.append(time.time())
+        yield Sleep(0.02)
+
+def caller(i, results):
+    value = yield RunInThread(blocking, 0.2, i)
+    results.append(value)
+
+def test():
+    results = []
+    start = time.time()
+    tick_task = yield NewTask(ticker())
+    callers = []
+    for i in range(5):
+        callers.append((yield NewTask(caller(i, results))))
+    for taskid in callers:
+        yield WaitTask(taskid)
+    yield WaitTask(tick_task)
+    # run in parallel, not one after another
+    assert time.time() - start < 0.4, time.time() - start
+    assert sorted(results) == range(5), results
+    assert len(ticks) == 5
+    try:
+        yield RunInThread(fail)
+    except ValueError, e:
+        assert str(e) == 'fail in thread'
+    else:
+        assert False, 'ValueError not raise'
+    assert s.thread_pool.pending == 0
+    print 'threadpool test ok', s.thread_pool
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
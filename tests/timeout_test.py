@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ReadWait / WriteWait timeout test
+"""
+import time
+import socket
+
+from litchi.schedule import get_scheduler
+from litchi.socketwrap import Socket
+from litchi.systemcall import ReadWait, TimeoutError
+
+cleanups = []
+
+
+def inner_read(sock):
+    try:
+        yield ReadWait(sock, timeout=0.1)
+    finally:
+        cleanups.append('inner')
+
+def read_timeout(sock):
+    start = time.time()
+    try:
+        yield inner_read(sock)
+    except TimeoutError:
+        pass
+    else:
+        assert False, 'TimeoutError not raise'
+    assert 0.1 <= time.time() - start < 0.15
+    assert cleanups == ['inner'], cleanups
+    assert sock.fileno() not in s.read_waiting
+    assert not s.timeout_waiting
+
+def read_until_timeout(a, b):
+    a = Socket(_sock=a)
+    b.send('abc')
+    start = time.time()
+    try:
+        yield a.read_until('\r\n', timeout=0.1)
+    except TimeoutError:
+        pass
+    else:
+        assert False, 'TimeoutError not raise'
+    assert 0.1 <= time.time() - start < 0.15
+    # no timeout when the data come in time
+    b.send('def\r\n')
+    data = yield a.read_until('\r\n', timeout=0.1)
+    assert data == 'abcdef\r\n', data
+    assert not s.timeout_waiting
+
+def test():
+    a, b = socket.socketpair()
+    yield read_timeout(a)
+    yield read_until_timeout(a, b)
+    print 'timeout test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""unit test for the scheduler's timer queue
+"""
+
+from litchi.schedule import _TimerQueue
+
+
+def test_order():
+    fired = []
+    timers = _TimerQueue()
+    timers.add(3, fired.append, 'c')
+    timers.add(1, fired.append, 'a')
+    timers.add(2, fired.append, 'b')
+    timers.add(2, fired.append, 'b2')
+    assert len(timers) == 4
+    assert timers.next_deadline() == 1
+    timers.run_expired(2)
+    assert fired == ['a', 'b', 'b2'], fired
+    assert len(timers) == 1
+    timers.run_expired(10)
+    assert fired == ['a', 'b', 'b2', 'c'], fired
+    assert timers.next_deadline() is None
+
+def test_cancel():
+    fired = []
+    timers = _TimerQueue()
+    t1 = timers.add(1, fired.append, 1)
+    timers.add(2, fired.append, 2)
+    timers.cancel(t1)
+    timers.cancel(t1) # cancel twice is fine
+    assert len(timers) == 1
+    assert timers.next_deadline() == 2
+    timers.run_expired(5)
+    assert fired == [2], fired
+    
+    # many cancelled timers will be compacted
+    many = [timers.add(i, fired.append, i) for i in xrange(2000)]
+    for t in many[:1500]:
+        timers.cancel(t)
+    assert len(timers) == 500
+    assert len(timers.heap) < 2000
+    
+def test_cancel_in_callback():
+    # a callback cancels enough timers to compact the heap while run_expired() pops it
+    fired = []
+    timers = _TimerQueue()
+    later = [timers.add(10 + i, fired.append, 'cancelled') for i in xrange(1000)]
+    def cancel_all():
+        for t in later:
+            timers.cancel(t)
+        fired.append('cancel')
+    timers.add(1, cancel_all)
+    timers.add(2, fired.append, 'after')
+    keep = timers.add(20000, fired.append, 'kept')
+    timers.run_expired(5000)
+    assert fired == ['cancel', 'after'], fired
+    assert len(timers) == 1 and timers._cancelled == 0, (len(timers), timers._cancelled)
+    assert timers.next_deadline() == 20000
+    timers.run_expired(30000)
+    assert fired == ['cancel', 'after', 'kept'], fired
+    assert len(timers) == 0
+
+test_order()
+test_cancel()
+test_cancel_in_callback()
+print 'timer test ok'
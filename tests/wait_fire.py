@@ -3,7 +3,7 @@
 """wait and fire call test
 """
 
-from litchi.schedule import Scheduler
+from litchi.schedule import get_scheduler
 from litchi.systemcall import Wait, Fire
 
 def wait():
@@ -24,7 +24,7 @@ def fire():
     yield Fire('aaa', ('something', 123))
     print 'fire end'
     
-s = Scheduler.instance()
+s = get_scheduler()
 s.new(wait())
 s.new(wait2())
 s.new(fire())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""WaitAll / WaitAny test
+"""
+import time
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import NewTask, WaitAll, WaitAny, Sleep, TimeoutError
+
+
+def backend(seconds, value):
+    yield Sleep(seconds)
+    yield value
+
+def failed(seconds):
+    yield Sleep(seconds)
+    raise ValueError('backend failed')
+
+def fanout():
+    start = time.time()
+    tasks = []
+    for i in range(3):
+        tasks.append((yield NewTask(backend(0.1 * (i + 1), i), joinable=True)))
+    # finished before WaitAll
+    tasks.append((yield NewTask(backend(0, 'fast'), joinable=True)))
+    yield Sleep(0.01)
+    results = yield WaitAll(tasks)
+    assert results == [0, 1, 2, 'fast'], results
+    # the latency is the max, not the sum
+    assert 0.3 <= time.time() - start < 0.4, time.time() - start
+    assert not s.exit_results
+
+def any_():
+    slow = yield NewTask(backend(0.3, 'slow'), joinable=True)
+    fast = yield NewTask(backend(0.1, 'fast'), joinable=True)
+    taskid, result = yield WaitAny([slow, fast])
+    assert (taskid, result) == (fast, 'fast')
+    assert (yield WaitAll([slow])) == ['slow']
+
+def errors():
+    ok = yield NewTask(backend(0.1, 'ok'), joinable=True)
+    bad = yield NewTask(failed(0.05), joinable=True)
+    try:
+        yield WaitAll([ok, bad])
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError not raise'
+    slow = yield NewTask(backend(0.3, 'slow'), joinable=True)
+    start = time.time()
+    try:
+        yield WaitAll([slow], timeout=0.1)
+    except TimeoutError:
+        assert 0.1 <= time.time() - start < 0.15
+    else:
+        assert False, 'TimeoutError not raise'
+    assert not s.exit_waiting
+    yield WaitAny([slow])
+
+def detached():
+    # the losers of WaitAny and the tasks left by a timed out WaitAll are not kept
+    for _ in range(100):
+        tasks = [(yield NewTask(backend(0.01, 'fast'), joinable=True)),
+                 (yield NewTask(backend(0.02, 'slow'), joinable=True))]
+        assert (yield WaitAny(tasks)) == (tasks[0], 'fast')
+    slow = yield NewTask(backend(0.05, 'slow'), joinable=True)
+    try:
+        yield WaitAll([slow], timeout=0.01)
+    except TimeoutError:
+        pass
+    yield Sleep(0.1)
+    assert not s.exit_results and not s.detached, (s.exit_results, s.detached)
+
+def test():
+    yield fanout()
+    yield any_()
+    yield errors()
+    yield detached()
+    assert not s.exit_results, s.exit_results
+    print 'waitall test ok'
+
+s = get_scheduler()
+s.new(test())
+s.mainloop()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""blocking task watchdog test
+"""
+import time
+import logging
+
+from litchi.schedule import get_scheduler
+from litchi.systemcall import Sleep
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+        
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def blocking_call():
+    time.sleep(0.2)
+
+def handler():
+    yield Sleep(0.01)
+    blocking_call()
+    yield Sleep(0.01)
+
+def fast():
+    for _ in range(10):
+        yield Sleep(0.001)
+
+def test():
+    records = Records()
+    logging.root.addHandler(records)
+    s = get_scheduler()
+    s.new(handler(), 'slowhandler')
+    s.new(fast(), 'fasthandler')
+    s.mainloop(watchdog=0.05, watchdog_thread=True)
+    logging.root.removeHandler(records)
+    
+    step = [m for m in records.messages if 'blocked the loop' in m]
+    assert len(step) == 1, records.messages
+    assert 'slowhandler' in step[0] and 'in handler' in step[0], step[0]
+    stuck = [m for m in records.messages if 'still running' in m]
+    assert len(stuck) == 1, records.messages
+    # the thread see where the task stuck
+    assert 'slowhandler' in stuck[0] and 'blocking_call' in stuck[0], stuck[0]
+    assert s.watchdog is None and s.running is None
+    print 'watchdog test ok'
+    
+test()